@@ -1,32 +1,45 @@
 import asyncio
 import hashlib
-import json
-import os
-import tempfile
+import re
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import List, Literal, Optional
 
-import aiofiles
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel, HttpUrl
-
-from config.load_config import OUTPUT_PATH, RUNPOD_POD_ID, UI_TYPE
+from starlette.background import BackgroundTask
+
+from config.load_config import (
+    EXPORT_COMPRESS_LEVEL,
+    OUTPUT_PATH,
+    RUNPOD_POD_ID,
+    UI_TYPE,
+)
 from env_manager import envs
 from history_manager import downloadHistory
+from utils.tracing import tracer
+from utils.transcode import TranscodeOptions
 from worker.check_process import programStatus
 from worker.download import download_multiple, queue_download
-from worker.export_zip import _create_zip_file
+from worker.export_cache import export_fingerprint, exportCache
+from worker.export_manifest import exportManifest
+from worker.export_zip import _scan_output_files, stream_zip
+from worker.gpu_probe import gpuProbe
+from worker.model_packs import modelPacks
+from worker.output_index import outputIndex
 from worker.program_logs import programLog
-from worker.restart_program import restart_program
-
-if UI_TYPE == "ZIMAGE":
-    pass
-else:
-    import torch
-
-    print("import torch completed")
+from worker.restart_program import restartJobs
+from worker.thumbnails import DEFAULT_SIZE as DEFAULT_THUMBNAIL_SIZE
+from worker.thumbnails import ThumbnailNotFound, thumbnailCache
 
 
 class ModelDownloadRequest(BaseModel):
@@ -51,6 +64,11 @@ class ImportModel(BaseModel):
 router = APIRouter(prefix="/api")
 
 
+def _probe_latency():
+    latency = programStatus.latency.summary()
+    return latency.model_dump() if latency else None
+
+
 @router.get("/checkcuda")
 async def checkcuda():
     if UI_TYPE == "ZIMAGE":
@@ -61,31 +79,32 @@ async def checkcuda():
                 "pytorch_version": "skipped",
                 "runpod_id": RUNPOD_POD_ID,
                 "status": programStatus.get_status(),
+                "probe_latency": _probe_latency(),
                 "ui": UI_TYPE,
             }
         )
 
-    is_cuda_available = torch.cuda.is_available()
-    if not is_cuda_available:
+    gpu = await gpuProbe.get()
+    if not gpu["cuda"]:
         return JSONResponse(
             {
-                "cuda": is_cuda_available,
+                "cuda": False,
                 "gpu_name": "",
-                "pytorch_version": torch.__version__,
+                "pytorch_version": gpu["pytorch_version"],
                 "runpod_id": RUNPOD_POD_ID,
                 "status": "NOT_RUNNING",
+                "probe_latency": _probe_latency(),
                 "ui": UI_TYPE,
             }
         )
-    current_device = torch.cuda.current_device()
-    gpu_name = torch.cuda.get_device_name(current_device)
     return JSONResponse(
         {
-            "cuda": is_cuda_available,
-            "gpu_name": gpu_name,
-            "pytorch_version": torch.__version__,
+            "cuda": True,
+            "gpu_name": gpu["gpu_name"],
+            "pytorch_version": gpu["pytorch_version"],
             "runpod_id": RUNPOD_POD_ID,
             "status": programStatus.get_status(),
+            "probe_latency": _probe_latency(),
             "ui": UI_TYPE,
         }
     )
@@ -96,17 +115,28 @@ async def getDownloadHistory():
     return await downloadHistory.get()
 
 
-@router.get("/get_model_packs")
-async def getModelPacks():
-    if UI_TYPE == "ZIMAGE":
-        return JSONResponse([])
-
-    target = f"./resources/{UI_TYPE.lower()}_model_packs.json"
+@router.get("/downloads/{download_id}/timeline")
+async def download_timeline(download_id: str):
+    """
+    Stages of the last traced request for a download, with their start
+    offset and duration in ms. Needs TRACE_DOWNLOADS=true.
+    """
+    timeline = tracer.timeline(download_id)
+    if timeline is None:
+        detail = "No trace for this download"
+        if not tracer.enabled:
+            detail = "Tracing is off; set TRACE_DOWNLOADS=true"
+        raise HTTPException(status_code=404, detail=detail)
+    return timeline
 
-    async with aiofiles.open(target) as fp:
-        model_packs = json.loads(await fp.read())
 
-    return JSONResponse(model_packs)
+@router.get("/get_model_packs")
+async def getModelPacks(request: Request):
+    catalog = await modelPacks.get()
+    headers = {"ETag": catalog.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == catalog.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(catalog.body, media_type="application/json", headers=headers)
 
 
 @router.put("/update_env/{api_key_type}", status_code=204)
@@ -166,7 +196,15 @@ async def download_custom_model(
     try:
         model_name = request.model_type if request.name in ("", None) else request.name
 
-        result = await queue_download(model_name, str(request.url), request.model_type)
+        # The query string can carry an API token
+        with tracer.trace(
+            "download_custom_model",
+            url=str(request.url).split("?")[0],
+            model_type=request.model_type,
+        ):
+            result = await queue_download(
+                model_name, str(request.url), request.model_type
+            )
 
         if result.action == "retrying":
             return JSONResponse(
@@ -206,20 +244,138 @@ async def download_custom_model(
 
 
 @router.get("/logs")
-def get_program_log():
-    return programLog.get()
+def get_program_log(
+    tail: Optional[int] = Query(None, ge=0),
+    since: Optional[int] = Query(None, ge=0),
+    before: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=0),
+):
+    return programLog.get(tail=tail, since=since, before=before, limit=limit)
+
+
+@router.get("/logs/search")
+async def search_program_log(
+    q: Optional[str] = None,
+    regex: bool = False,
+    ignore_case: bool = True,
+    level: Optional[List[Literal["error", "warning", "info", "debug"]]] = Query(None),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Optional[int] = Query(None, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    # Log timestamps are naive local time
+    if start is not None and start.tzinfo is not None:
+        start = start.astimezone().replace(tzinfo=None)
+    if end is not None and end.tzinfo is not None:
+        end = end.astimezone().replace(tzinfo=None)
 
+    try:
+        return await asyncio.to_thread(
+            programLog.search,
+            query=q,
+            regex=regex,
+            ignore_case=ignore_case,
+            levels=level,
+            start=start,
+            end=end,
+            before=before,
+            limit=limit,
+        )
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid regex: {str(e)}")
 
-@router.post("/restart", status_code=204)
+
+@router.post("/restart", status_code=202)
 async def restart():
-    await restart_program()
+    """
+    Start restarting the UI and return at once. Progress is streamed as
+    "restart" WebSocket messages and can be polled at /api/restart/{id}.
+    """
+    job = restartJobs.start()
+    return {"id": job.id, "phase": job.phase}
+
+
+@router.get("/restart/{job_id}")
+async def restart_status(job_id: str):
+    job = restartJobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown restart job")
+    return job.to_dict()
+
+
+@router.get("/outputs")
+async def list_outputs(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    sort: Literal["mtime", "name", "size"] = "mtime",
+    order: Literal["asc", "desc"] = "desc",
+):
+    """
+    Images below OUTPUT_PATH with their size, mtime and dimensions, newest
+    first by default. ``ready`` is false until the first scan has finished.
+    """
+    return outputIndex.query(offset, limit, sort, order)
+
+
+@router.get("/outputs/{path:path}/thumbnail")
+async def output_thumbnail(
+    path: str,
+    request: Request,
+    size: int = Query(DEFAULT_THUMBNAIL_SIZE, ge=32, le=1024),
+    v: Optional[str] = None,
+):
+    """
+    WebP thumbnail of an output image that fits in ``size`` x ``size``.
+
+    Clients that pass the image's mtime as ``v`` may cache the response
+    forever; without it the response must be revalidated with its ETag.
+    """
+    try:
+        thumbnail, key = await thumbnailCache.get(path, size)
+    except ThumbnailNotFound:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except Exception as e:
+        raise HTTPException(
+            status_code=422, detail=f"Cannot render thumbnail: {str(e)}"
+        )
+
+    headers = {
+        "ETag": f'"{key}"',
+        "Cache-Control": "public, max-age=31536000, immutable"
+        if v is not None
+        else "no-cache",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(thumbnail, media_type="image/webp", headers=headers)
+
+
+@router.get("/download-images/exports")
+async def list_image_exports():
+    """Recent image exports, newest first, usable as ``since`` values."""
+    return await asyncio.to_thread(exportManifest.list)
 
 
 @router.get("/download-images")
-async def download_images_zip():
+async def download_images_zip(
+    level: Optional[int] = Query(None, ge=0, le=9),
+    since: Optional[str] = None,
+    format: Literal["original", "webp", "jpeg"] = "original",
+    quality: int = Query(90, ge=1, le=100),
+    max_dim: Optional[int] = Query(None, ge=16),
+):
     """
-    Creates a zip file of all images in ./output_images folder (recursive)
-    and returns it as a streaming download with Content-Disposition header.
+    Streams a zip of all images in the OUTPUT_PATH folder (recursive) as it is
+    being built, with a Content-Disposition header. ``level`` overrides
+    EXPORT_COMPRESS_LEVEL for files that are worth compressing.
+
+    ``since`` limits the zip to files created or modified after a previous
+    export (its id, or ``last``) or a timestamp; the id of this export is
+    returned in the X-Export-Id header.
+
+    ``format`` re-encodes images as WebP or JPEG at ``quality``, scaled down
+    to fit ``max_dim``; workflow metadata is kept in their EXIF.
     """
     output_dir = Path(OUTPUT_PATH)
     # Check if the directory exists (using async path operations)
@@ -228,64 +384,76 @@ async def download_images_zip():
     ):
         raise HTTPException(status_code=404, detail="Output images directory not found")
 
-    # Create a temporary file for the zip
-    temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-    temp_zip_path = temp_zip.name
-    temp_zip.close()
+    since_timestamp = None
+    if since is not None:
+        try:
+            since_timestamp = await asyncio.to_thread(
+                exportManifest.resolve_since, since
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
+    started_at = time.time()
     try:
-        # Create zip file asynchronously
-        await _create_zip_file(output_dir, temp_zip_path)
-
-        # Check if zip file was created and has content (non-blocking)
-        file_exists = await asyncio.to_thread(os.path.exists, temp_zip_path)
-        file_size = (
-            await asyncio.to_thread(os.path.getsize, temp_zip_path)
-            if file_exists
-            else 0
-        )
-
-        if not file_exists or file_size == 0:
-            raise HTTPException(status_code=404, detail="No files found to zip")
-
-        # Define async generator to stream file content
-        async def file_streamer():
-            try:
-                async with aiofiles.open(temp_zip_path, "rb") as file:
-                    while chunk := await file.read(8192):  # 8KB chunks
-                        yield chunk
-            finally:
-                # Clean up temp file after streaming
-                try:
-                    if await asyncio.to_thread(os.path.exists, temp_zip_path):
-                        await asyncio.to_thread(os.unlink, temp_zip_path)
-                except:
-                    pass  # Ignore cleanup errors
-
-        # Generate filename with YYYY-MM-DD and short hash
-        date_str = datetime.now().strftime("%Y-%m-%d")
-        short_hash = hashlib.sha256(
-            str(datetime.now().timestamp()).encode()
-        ).hexdigest()[:8]
-        filename = f"output_images_{date_str}_{short_hash}.zip"
-
-        # Return streaming response with Content-Disposition header
-        return StreamingResponse(
-            file_streamer(),
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "Content-Length": str(file_size),
-            },
+        members = await asyncio.to_thread(
+            _scan_output_files, output_dir, since_timestamp
         )
-
     except Exception as e:
-        # Clean up temp file if something goes wrong (non-blocking)
-        try:
-            if await asyncio.to_thread(os.path.exists, temp_zip_path):
-                await asyncio.to_thread(os.unlink, temp_zip_path)
-        except:
-            pass  # Ignore cleanup errors
         raise HTTPException(
             status_code=500, detail=f"Error creating zip file: {str(e)}"
         )
+
+    if not members:
+        if since_timestamp is not None:
+            return Response(status_code=204)
+        raise HTTPException(status_code=404, detail="No files found to zip")
+
+    # Generate filename with YYYY-MM-DD and short hash
+    date_str = datetime.now().strftime("%Y-%m-%d")
+    timestamp = str(datetime.now().timestamp()).encode()
+    short_hash = hashlib.sha256(timestamp).hexdigest()[:8]
+    filename = f"output_images_{date_str}_{short_hash}.zip"
+
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "X-Export-Id": short_hash,
+    }
+    level = EXPORT_COMPRESS_LEVEL if level is None else level
+    transcode = None
+    if format != "original":
+        transcode = TranscodeOptions(format, quality, max_dim)
+
+    def record_export():
+        exportManifest.record(
+            short_hash,
+            started_at,
+            since_timestamp,
+            len(members),
+            sum(member.size for member in members),
+        )
+
+    if not exportCache.enabled:
+        chunks = stream_zip(members, level, transcode)
+    else:
+        key = export_fingerprint(members, level, transcode)
+        cached = await asyncio.to_thread(exportCache.lookup, key)
+        if cached is not None:
+            # Supports Range, so interrupted downloads can resume
+            return FileResponse(
+                cached,
+                media_type="application/zip",
+                headers=headers,
+                background=BackgroundTask(record_export),
+            )
+        chunks = exportCache.stream(key, members, level, transcode)
+
+    async def stream_export():
+        async for chunk in chunks:
+            yield chunk
+        # Only a fully sent export counts as a point to continue from
+        await asyncio.to_thread(record_export)
+
+    # Return streaming response with Content-Disposition header
+    return StreamingResponse(
+        stream_export(), media_type="application/zip", headers=headers
+    )
@@ -11,13 +11,34 @@ HOST = os.getenv("HOST") or "127.0.0.1"  # host for running app
 
 UI_TYPE = os.getenv("UI_TYPE") or "COMFY"  # COMFY, FORGE, INVOKEAI
 RESOURCE_PATH = os.getenv("RESOURCE_PATH") or "./my-runpod-volume/models"
+# HTTP path on the UI that answers once it is ready (e.g. /system_stats for
+# ComfyUI); empty checks that its port accepts connections
+UI_READY_PATH = os.getenv("UI_READY_PATH") or ""
 LOG_PATH = os.getenv("LOG_PATH") or "./backend.log"
 PROGRAM_LOG = os.getenv("PROGRAM_LOG") or "./program.log"
+# lines of PROGRAM_LOG kept in memory, and bytes read from its end at startup
+LOG_BUFFER_LINES = int(os.getenv("LOG_BUFFER_LINES") or "10000")
+LOG_TAIL_BYTES = int(os.getenv("LOG_TAIL_BYTES") or str(8 * 1024 * 1024))
 
 RUNPOD_POD_ID = os.environ.get("RUNPOD_POD_ID") or "xxxxxxxxxxxxxx"
 
 JUPYTER_LAB_PORT = os.environ.get("JUPYTER_LAB_PORT") or "8888"
 
 OUTPUT_PATH = os.environ.get("OUTPUT_PATH") or "./output_images/"
+# zlib level (0-9) for exported members that are worth compressing
+EXPORT_COMPRESS_LEVEL = int(os.getenv("EXPORT_COMPRESS_LEVEL") or "6")
+# backend state that survives restarts (export manifest, caches)
+CACHE_PATH = os.getenv("CACHE_PATH") or "./.cache"
+# disk budget for cached export archives; 0 streams every export uncached
+EXPORT_CACHE_BYTES = int(os.getenv("EXPORT_CACHE_BYTES") or str(4 * 1024**3))
+# disk budget for output thumbnails and the processes that render them
+THUMBNAIL_CACHE_BYTES = int(os.getenv("THUMBNAIL_CACHE_BYTES") or str(512 * 1024**2))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS") or "1")
+# look up model pack checksums at startup so pack downloads start at once
+MODEL_PACK_WARMUP = os.getenv("MODEL_PACK_WARMUP") != "false"
+# record per-stage spans of each download in CACHE_PATH/traces.jsonl, and
+# optionally post them to an OTLP/HTTP collector (e.g. http://localhost:4318)
+TRACE_DOWNLOADS = "true" == os.getenv("TRACE_DOWNLOADS")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT") or ""
 
 DEBUG = os.getenv("DEBUG") == "1"
@@ -1,5 +1,14 @@
+import time
+
 from fastapi import WebSocket
 
+from utils.metrics import registry
+
+BROADCAST_SECONDS = registry.histogram(
+    "sdui_websocket_broadcast_seconds",
+    "Time to send one message to every WebSocket client",
+)
+
 
 class ConnectionManager:
     def __init__(self):
@@ -16,7 +25,15 @@ class ConnectionManager:
         await websocket.send_text(message)
 
     async def broadcast(self, message: str):
+        start = time.perf_counter()
         [await connection.send_text(message) for connection in self.active_connections]
+        BROADCAST_SECONDS.observe(time.perf_counter() - start)
 
 
 manager = ConnectionManager()
+
+registry.gauge(
+    "sdui_websocket_clients",
+    "Connected WebSocket clients",
+    fn=lambda: len(manager.active_connections),
+)
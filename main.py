@@ -1,31 +1,42 @@
 import asyncio
 import json
-import os
 from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 
 import config.load_config as CONFIG
 from api import router
 from event_handler import manager
+from static_manager import staticSite
+from utils.compression import JSONCompressionMiddleware
+from utils.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.metrics import registry
 from worker.check_process import programStatus
+from worker.model_packs import modelPacks
+from worker.output_index import outputIndex
 from worker.program_logs import programLog
+from worker.thumbnails import thumbnailCache
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await asyncio.to_thread(staticSite.scan)
     task1 = asyncio.create_task(programLog.monitor_log())
     task2 = asyncio.create_task(
         programStatus.ping_check("127.0.0.1", programStatus.MAP_PORT[CONFIG.UI_TYPE])
     )
+    task3 = asyncio.create_task(outputIndex.monitor())
+    task4 = asyncio.create_task(thumbnailCache.pregenerate())
+    tasks = [task1, task2, task3, task4]
+    if CONFIG.MODEL_PACK_WARMUP:
+        tasks.append(asyncio.create_task(modelPacks.warm_up()))
     yield
-    task1.cancel()
-    task2.cancel()
-    await asyncio.gather(task1, task2, return_exceptions=True)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
 
 
 app = FastAPI(docs_url=None, redoc_url=None, lifespan=lifespan)
@@ -34,6 +45,7 @@ app.include_router(router)
 
 origins = ["*"]
 
+app.add_middleware(JSONCompressionMiddleware, minimum_size=1024)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -42,39 +54,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount the static files from the NextJS export
-# app.mount("/static", StaticFiles(directory="web/static"), name="static")
-app.mount("/_next", StaticFiles(directory="web/_next"), name="next_assets")
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint; must come before the catch-all below."""
+    return PlainTextResponse(registry.render(), media_type=METRICS_CONTENT_TYPE)
 
-# For other static files in the root directory
-@app.get("/favicon.ico")
-async def favicon():
-    return FileResponse("web/favicon.ico")
 
-
-# Route all other requests to the NextJS index.html
+# Serve the NextJS export (including _next assets and favicon.ico) from the
+# route table built at startup; unknown pages get index.html
 @app.get("/{full_path:path}")
 async def serve_nextjs(full_path: str, request: Request):
     # Skip API and WebSocket paths — let their own routers handle them
     if full_path.startswith(("api/", "ws/")):
         raise HTTPException(status_code=404)
 
-    # Try to serve the exact path
-    path = f"web/{full_path}"
-
-    # Check if the path exists and is a file
-    if os.path.exists(path) and os.path.isfile(path):
-        return FileResponse(path)
-
-    # If path is a directory, look for index.html
-    if os.path.exists(path) and os.path.isdir(path):
-        index_path = os.path.join(path, "index.html")
-        if os.path.exists(index_path):
-            return FileResponse(index_path)
-
-    # Fall back to the main index.html for client-side routing
-    return FileResponse("web/index.html")
+    asset = staticSite.lookup(full_path)
+    if asset is None:
+        raise HTTPException(status_code=404)
+    return staticSite.response(asset, request)
 
 
 @app.websocket("/ws/{client_id}")
@@ -0,0 +1,200 @@
+import hashlib
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import NamedTuple
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+from config.load_config import CACHE_PATH
+from utils.compression import ENCODINGS, choose_encoding, compress
+
+# Next.js puts a content hash in every file name below _next/static
+IMMUTABLE_PREFIX = "_next/static/"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Files up to this size are served from memory
+INLINE_MAX_SIZE = 64 * 1024
+# Text assets at least this big get gzip (and brotli) variants
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = (
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+)
+_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+
+class StaticVariant(NamedTuple):
+    path: str
+    size: int
+    body: bytes | None
+
+
+class StaticAsset(NamedTuple):
+    path: str
+    media_type: str
+    size: int
+    mtime: float
+    etag: str
+    cache_control: str
+    body: bytes | None
+    variants: dict[str, StaticVariant]
+
+
+def _is_compressible(media_type: str, size: int) -> bool:
+    return size >= COMPRESS_MIN_SIZE and (
+        media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+    )
+
+
+def _load_variants(path: str, content_hash: str, cache_dir: Path):
+    """Compressed copies of ``path``, made once and kept in ``cache_dir``."""
+    variants = {}
+    data = None
+    for encoding in ENCODINGS:
+        variant_path = cache_dir / f"{content_hash}{_SUFFIXES[encoding]}"
+        if not variant_path.exists():
+            if data is None:
+                with open(path, "rb") as fp:
+                    data = fp.read()
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = variant_path.with_name(variant_path.name + ".tmp")
+            tmp_path.write_bytes(compress(data, encoding))
+            os.replace(tmp_path, variant_path)
+
+        size = variant_path.stat().st_size
+        body = variant_path.read_bytes() if size <= INLINE_MAX_SIZE else None
+        variants[encoding] = StaticVariant(str(variant_path), size, body)
+    return variants
+
+
+def _load_asset(rel_path: str, path: str, cache_dir: Path) -> StaticAsset:
+    st = os.stat(path)
+    digest = hashlib.sha256()
+    body = None
+    with open(path, "rb") as fp:
+        if st.st_size <= INLINE_MAX_SIZE:
+            body = fp.read()
+            digest.update(body)
+        else:
+            while chunk := fp.read(1024 * 1024):
+                digest.update(chunk)
+
+    content_hash = digest.hexdigest()[:32]
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if rel_path.startswith(IMMUTABLE_PREFIX):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = REVALIDATE_CACHE_CONTROL
+    variants = {}
+    if _is_compressible(media_type, st.st_size):
+        variants = _load_variants(path, content_hash, cache_dir)
+    return StaticAsset(
+        path,
+        media_type,
+        st.st_size,
+        st.st_mtime,
+        f'"{content_hash}"',
+        cache_control,
+        body,
+        variants,
+    )
+
+
+class StaticSite:
+    """
+    Route table for the exported Next.js frontend, built by scanning the web
+    folder once, so requests never touch the filesystem to find a file.
+
+    Text assets are compressed once into ``cache_dir``, keyed by their
+    content hash, and the best variant is picked from Accept-Encoding.
+    """
+
+    def __init__(self, root: str, cache_dir: Path):
+        self.root = root
+        self.cache_dir = cache_dir
+        self._routes: dict[str, StaticAsset] | None = None
+
+    def scan(self) -> None:
+        routes = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+                routes[rel_path] = _load_asset(rel_path, path, self.cache_dir)
+
+        # A folder is served by its index.html
+        for rel_path, asset in list(routes.items()):
+            if rel_path.endswith("/index.html"):
+                routes.setdefault(rel_path[: -len("/index.html")], asset)
+        self._routes = routes
+
+        # Variants of assets from earlier builds of the frontend
+        in_use = {
+            variant.path
+            for asset in routes.values()
+            for variant in asset.variants.values()
+        }
+        if self.cache_dir.is_dir():
+            for path in self.cache_dir.iterdir():
+                if str(path) not in in_use:
+                    path.unlink(missing_ok=True)
+
+    def lookup(self, full_path: str) -> StaticAsset | None:
+        """The asset for a request path, falling back to index.html."""
+        if self._routes is None:
+            self.scan()
+        full_path = full_path.strip("/")
+        asset = self._routes.get(full_path)
+        if asset is None and not full_path.startswith("_next/"):
+            # Client-side routing takes over from the main page
+            asset = self._routes.get("index.html")
+        return asset
+
+    def response(self, asset: StaticAsset, request: Request) -> Response:
+        encoding = choose_encoding(
+            request.headers.get("accept-encoding"), tuple(asset.variants)
+        )
+        etag = asset.etag
+        path, body = asset.path, asset.body
+        headers = {
+            "Last-Modified": formatdate(asset.mtime, usegmt=True),
+            "Cache-Control": asset.cache_control,
+        }
+        if asset.variants:
+            headers["Vary"] = "Accept-Encoding"
+        if encoding != "identity":
+            # Each representation needs its own strong ETag
+            etag = f'{etag[:-1]}-{encoding}"'
+            path, _, body = asset.variants[encoding]
+            headers["Content-Encoding"] = encoding
+        headers["ETag"] = etag
+
+        if _not_modified(request, etag, asset.mtime):
+            return Response(status_code=304, headers=headers)
+        if body is not None:
+            return Response(body, media_type=asset.media_type, headers=headers)
+        return FileResponse(path, media_type=asset.media_type, headers=headers)
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in tags or "*" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+staticSite = StaticSite("web", Path(CACHE_PATH) / "static")
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from worker import check_process
+from worker.check_process import LatencyHistogram, ProgramStatus, Status
+
+
+class ProbeTests(unittest.IsolatedAsyncioTestCase):
+    async def serve(self, responses: list[bytes]) -> int:
+        async def handle(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            writer.write(responses.pop(0) if responses else b"")
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        return server.sockets[0].getsockname()[1]
+
+    async def test_tcp_probe(self) -> None:
+        status = ProgramStatus(ready_path="")
+        server = await asyncio.start_server(lambda r, w: w.close(), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        self.assertEqual(await status.probe("127.0.0.1", port), Status.RUNNING)
+        server.close()
+        await server.wait_closed()
+        self.assertEqual(await status.probe("127.0.0.1", port), Status.NOT_RUNNING)
+        self.assertEqual(status.latency.summary().count, 1)
+
+    async def test_http_readiness_probe(self) -> None:
+        port = await self.serve(
+            [
+                b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n",
+                b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}",
+            ]
+        )
+        status = ProgramStatus(ready_path="/system_stats")
+
+        # The port is open, but the UI is still loading
+        self.assertEqual(await status.probe("127.0.0.1", port), Status.NOT_RUNNING)
+        self.assertEqual(await status.probe("127.0.0.1", port), Status.RUNNING)
+
+
+class PingCheckTests(unittest.IsolatedAsyncioTestCase):
+    async def test_backs_off_once_settled(self) -> None:
+        status = ProgramStatus()
+        interval = check_process.PROBE_MIN_INTERVAL
+        intervals = []
+        for _ in range(7):
+            interval = status._next_interval(interval)
+            intervals.append(interval)
+
+        self.assertEqual(intervals, [0.5, 1.0, 2.0, 4.0, 5.0, 5.0, 5.0])
+
+        status.expect_restart()
+        self.assertEqual(status._next_interval(5.0), check_process.PROBE_MIN_INTERVAL)
+
+    async def test_restart_is_noticed_quickly(self) -> None:
+        status = ProgramStatus()
+        states = iter([Status.RUNNING] * 3 + [Status.NOT_RUNNING] * 3)
+        probes = []
+
+        async def probe(host, port):
+            probes.append(asyncio.get_running_loop().time())
+            return next(states, Status.RUNNING)
+
+        broadcast = AsyncMock()
+        with (
+            patch.object(status, "probe", probe),
+            patch.object(check_process.manager, "broadcast", broadcast),
+            patch.object(check_process, "PROBE_MIN_INTERVAL", 0.01),
+            patch.object(check_process, "PROBE_MAX_INTERVAL", 10),
+        ):
+            task = asyncio.create_task(status.ping_check("127.0.0.1", 1))
+            while len(probes) < 3:
+                await asyncio.sleep(0.01)
+            # Settled and backing off; a restart brings the probes back
+            status.expect_restart()
+            while broadcast.await_count < 3:
+                await asyncio.sleep(0.01)
+            task.cancel()
+
+        statuses = [
+            json.loads(call.args[0])["data"]["status"]
+            for call in broadcast.await_args_list
+        ]
+        self.assertEqual(statuses, ["RUNNING", "NOT_RUNNING", "RUNNING"])
+        self.assertLess(probes[-1] - probes[3], 1)
+        self.assertEqual(status.get_status(), "RUNNING")
+
+    async def test_wait_until_running_ignores_earlier_probes(self) -> None:
+        status = ProgramStatus()
+        states = iter([Status.RUNNING, Status.NOT_RUNNING, Status.RUNNING])
+        probed = asyncio.Event()
+
+        async def probe(host, port):
+            probed.set()
+            return next(states, Status.RUNNING)
+
+        with (
+            patch.object(status, "probe", probe),
+            patch.object(check_process.manager, "broadcast", AsyncMock()),
+            patch.object(check_process, "PROBE_MIN_INTERVAL", 0.01),
+        ):
+            task = asyncio.create_task(status.ping_check("127.0.0.1", 1))
+            await probed.wait()
+            await asyncio.sleep(0)
+            self.assertEqual(status.status, Status.RUNNING)
+
+            # Running already, but only a later probe counts
+            await status.wait_until_running(timeout=5)
+            task.cancel()
+
+        self.assertEqual(status.status, Status.RUNNING)
+        with self.assertRaises(TimeoutError):
+            await status.wait_until_running(timeout=0.05)
+
+
+class LatencyHistogramTests(unittest.TestCase):
+    def test_summary(self) -> None:
+        histogram = LatencyHistogram(size=100)
+        self.assertIsNone(histogram.summary())
+
+        for ms in range(1, 201):
+            histogram.observe(ms / 1000)
+        summary = histogram.summary()
+
+        # Only the last 100 probes are kept
+        self.assertEqual(summary.count, 100)
+        self.assertEqual(summary.p50_ms, 151)
+        self.assertEqual(summary.p95_ms, 196)
+        self.assertEqual(summary.max_ms, 200)
+        self.assertEqual(summary.buckets["100"], 0)
+        self.assertEqual(summary.buckets["250"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
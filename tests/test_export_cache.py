@@ -0,0 +1,122 @@
+import asyncio
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+from worker import export_cache, export_zip
+
+
+class ExportCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.output = Path(temp_dir.name, "output")
+        self.output.mkdir()
+        self.files = {f"{i:03}.png": os.urandom(200_000) for i in range(10)}
+        for name, content in self.files.items():
+            (self.output / name).write_bytes(content)
+        self.members = export_zip._scan_output_files(self.output)
+        self.cache_dir = Path(temp_dir.name, "cache")
+        self.cache = export_cache.ExportCache(self.cache_dir, 100 * 1024 * 1024)
+
+        self.builds = 0
+        original = export_cache._write_members
+
+        def counting_write_members(*args):
+            self.builds += 1
+            return original(*args)
+
+        counter = patch.object(export_cache, "_write_members", counting_write_members)
+        counter.start()
+        self.addCleanup(counter.stop)
+
+    async def read(self, stream) -> bytes:
+        return b"".join([chunk async for chunk in stream])
+
+    def assert_archive(self, data: bytes) -> None:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertEqual(
+                {n: archive.read(n) for n in archive.namelist()}, self.files
+            )
+
+    async def test_concurrent_requests_share_one_build(self) -> None:
+        key = export_cache.export_fingerprint(self.members, 6)
+
+        first, second = await asyncio.gather(
+            self.read(self.cache.stream(key, self.members, 6)),
+            self.read(self.cache.stream(key, self.members, 6)),
+        )
+
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(first, second)
+        self.assert_archive(first)
+
+    async def test_finished_archive_is_served_from_disk(self) -> None:
+        key = export_cache.export_fingerprint(self.members, 6)
+        self.assertIsNone(self.cache.lookup(key))
+
+        streamed = await self.read(self.cache.stream(key, self.members, 6))
+        cached = self.cache.lookup(key)
+
+        self.assertIsNotNone(cached)
+        self.assertEqual(cached.read_bytes(), streamed)
+        self.assertEqual(list(self.cache_dir.glob("*.part")), [])
+
+    async def test_build_finishes_after_the_client_leaves(self) -> None:
+        key = export_cache.export_fingerprint(self.members, 6)
+
+        stream = self.cache.stream(key, self.members, 6)
+        build = self.cache._builds[key]
+        await anext(stream)
+        await stream.aclose()
+        await build.task
+
+        self.assert_archive(self.cache.lookup(key).read_bytes())
+
+    async def test_fingerprint_changes_with_the_listing(self) -> None:
+        key = export_cache.export_fingerprint(self.members, 6)
+        touched = self.members[0]._replace(mtime=self.members[0].mtime + 1)
+
+        self.assertNotEqual(
+            export_cache.export_fingerprint([touched, *self.members[1:]], 6), key
+        )
+        self.assertNotEqual(export_cache.export_fingerprint(self.members, 0), key)
+
+    async def test_least_recently_used_archives_are_evicted(self) -> None:
+        keys = []
+        for i in range(3):
+            members = self.members[i * 3 : i * 3 + 3]
+            key = export_cache.export_fingerprint(members, 6)
+            await self.read(self.cache.stream(key, members, 6))
+            await asyncio.sleep(0)
+            keys.append(key)
+            os.utime(self.cache.lookup(key), (1000 + i, 1000 + i))
+
+        # Using the oldest archive makes the second one the eviction candidate
+        self.cache.lookup(keys[0])
+        self.cache._max_bytes = 1_300_000
+        self.cache._evict(keys[2])
+
+        self.assertIsNotNone(self.cache.lookup(keys[0]))
+        self.assertIsNone(self.cache.lookup(keys[1]))
+        self.assertIsNotNone(self.cache.lookup(keys[2]))
+
+    async def test_failed_build_ends_the_stream_with_an_error(self) -> None:
+        key = export_cache.export_fingerprint(self.members, 6)
+
+        with patch.object(
+            export_cache, "_write_members", side_effect=OSError("disk full")
+        ):
+            with self.assertRaises(RuntimeError):
+                await self.read(self.cache.stream(key, self.members, 6))
+
+        self.assertIsNone(self.cache.lookup(key))
+        self.assertEqual(list(self.cache_dir.glob("*.part")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import asyncio
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from worker import gpu_probe
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+FAKE_TORCH = """
+import os
+
+__version__ = "2.0.0+fake"
+
+with open(os.environ["FAKE_TORCH_COUNTER"], "a") as fp:
+    fp.write("probe\\n")
+
+
+class cuda:
+    @staticmethod
+    def is_available():
+        return True
+
+    @staticmethod
+    def current_device():
+        return 0
+
+    @staticmethod
+    def get_device_name(device):
+        return "Fake GPU"
+"""
+
+
+class GpuProbeTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        Path(temp_dir.name, "torch.py").write_text(FAKE_TORCH)
+        self.counter = Path(temp_dir.name, "probes")
+        env = patch.dict(
+            os.environ,
+            {"PYTHONPATH": temp_dir.name, "FAKE_TORCH_COUNTER": str(self.counter)},
+        )
+        env.start()
+        self.addCleanup(env.stop)
+
+    def probe_count(self) -> int:
+        return len(self.counter.read_text().splitlines())
+
+    async def test_probe_runs_once_and_is_cached(self) -> None:
+        probe = gpu_probe.GpuProbe()
+
+        results = await asyncio.gather(probe.get(), probe.get())
+        cached = await probe.get()
+
+        self.assertEqual(
+            results[0],
+            {"cuda": True, "gpu_name": "Fake GPU", "pytorch_version": "2.0.0+fake"},
+        )
+        self.assertEqual(results[1], results[0])
+        self.assertEqual(cached, results[0])
+        self.assertEqual(self.probe_count(), 1)
+
+    async def test_refresh_probes_again(self) -> None:
+        probe = gpu_probe.GpuProbe()
+
+        await probe.get()
+        probe.refresh()
+        await probe.get()
+
+        self.assertEqual(self.probe_count(), 2)
+
+    async def test_missing_torch_reports_no_cuda(self) -> None:
+        probe = gpu_probe.GpuProbe()
+
+        with patch.object(gpu_probe, "PROBE_SCRIPT", "import torch_missing"):
+            result = await probe.get()
+
+        self.assertEqual(result, {"cuda": False, "gpu_name": "", "pytorch_version": ""})
+
+
+class ColdStartTests(unittest.TestCase):
+    def test_api_import_does_not_load_torch(self) -> None:
+        script = (
+            "import json, resource, sys, time\n"
+            "start = time.perf_counter()\n"
+            "import api\n"
+            "print(json.dumps({\n"
+            "    'seconds': time.perf_counter() - start,\n"
+            "    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,\n"
+            "    'torch_loaded': 'torch' in sys.modules,\n"
+            "}))\n"
+        )
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            env = dict(
+                os.environ,
+                UI_TYPE="COMFY",
+                PROGRAM_LOG=str(Path(temp_dir, "program.log")),
+                LOG_PATH=str(Path(temp_dir, "backend.log")),
+            )
+            result = subprocess.run(
+                [sys.executable, "-c", script],
+                cwd=REPO_ROOT,
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        measured = json.loads(result.stdout.strip().splitlines()[-1])
+
+        print(
+            f"\nimport api: {measured['seconds'] * 1000:.0f} ms, "
+            f"max RSS {measured['max_rss_kb'] / 1024:.0f} MB"
+        )
+        self.assertFalse(measured["torch_loaded"])
+
+    @unittest.skipUnless(importlib.util.find_spec("torch"), "torch is not installed")
+    def test_report_cost_of_the_former_torch_import(self) -> None:
+        script = (
+            "import json, resource, time\n"
+            "start = time.perf_counter()\n"
+            "import torch\n"
+            "print(json.dumps({\n"
+            "    'seconds': time.perf_counter() - start,\n"
+            "    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,\n"
+            "}))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True
+        )
+        measured = json.loads(result.stdout.strip().splitlines()[-1])
+
+        print(
+            f"\nimport torch (previously done by api): "
+            f"{measured['seconds'] * 1000:.0f} ms, "
+            f"max RSS {measured['max_rss_kb'] / 1024:.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from utils import checksum
+from utils.metrics import Registry
+from worker import download
+
+
+class RegistryTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.registry = Registry()
+
+    def test_counter_and_gauge(self) -> None:
+        counter = self.registry.counter("bytes_total", "Bytes", ("host",))
+        counter.inc(10, host="civitai.com")
+        counter.inc(5, host="civitai.com")
+        counter.inc(host='a"b')
+        self.registry.gauge("clients", "Clients", fn=lambda: 3)
+
+        self.assertEqual(
+            self.registry.render(),
+            "# HELP bytes_total Bytes\n"
+            "# TYPE bytes_total counter\n"
+            'bytes_total{host="civitai.com"} 15\n'
+            'bytes_total{host="a\\"b"} 1\n'
+            "# HELP clients Clients\n"
+            "# TYPE clients gauge\n"
+            "clients 3\n",
+        )
+
+    def test_histogram_buckets_are_cumulative(self) -> None:
+        histogram = self.registry.histogram("wait", "Wait", buckets=(1, 5))
+        for value in (0.5, 1, 3, 60):
+            histogram.observe(value)
+
+        lines = self.registry.render().splitlines()[2:]
+        self.assertEqual(
+            lines,
+            [
+                'wait_bucket{le="1"} 2',
+                'wait_bucket{le="5"} 3',
+                'wait_bucket{le="+Inf"} 4',
+                "wait_sum 64.5",
+                "wait_count 4",
+            ],
+        )
+
+    def test_names_are_unique(self) -> None:
+        self.registry.counter("a", "A")
+        with self.assertRaises(ValueError):
+            self.registry.gauge("a", "A")
+
+
+class HotPathMetricsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_hashing_is_counted(self) -> None:
+        before = checksum.HASH_BYTES.get()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir, "model.safetensors")
+            path.write_bytes(b"x" * 3_000_000)
+            await checksum.compute_sha256(str(path))
+
+        self.assertEqual(checksum.HASH_BYTES.get() - before, 3_000_000)
+
+    async def test_download_run_moves_through_the_gauges(self) -> None:
+        labels = {"host": "example.com", "engine": "aria2c"}
+        completed = download.DOWNLOADS.get(result="completed", **labels)
+
+        run = download._DownloadRun("https://example.com/model.safetensors")
+        self.assertEqual(download.DOWNLOADS_QUEUED.get(), 1)
+        run.start()
+        run.engine = "aria2c"
+        self.assertEqual(
+            (download.DOWNLOADS_QUEUED.get(), download.DOWNLOADS_ACTIVE.get()), (0, 1)
+        )
+        run.finish(True)
+
+        self.assertEqual(download.DOWNLOADS_ACTIVE.get(), 0)
+        self.assertEqual(
+            download.DOWNLOADS.get(result="completed", **labels), completed + 1
+        )
+        self.assertEqual(download.DOWNLOAD_RUN_SECONDS.count(**labels), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import api
+from worker import download, model_packs
+
+PACKS = {
+    "SDXL": [
+        {"name": "SDXL", "url": "https://example.com/sdxl.json"},
+        {"name": "Pony", "url": "https://example.com/pony.json"},
+    ]
+}
+MANIFESTS = {
+    "https://example.com/sdxl.json": [
+        {"name": "base", "url": "https://example.com/base", "type": "checkpoints"},
+        {"name": "vae", "url": "https://example.com/vae", "type": "vae"},
+    ],
+    "https://example.com/pony.json": [
+        {"name": "pony", "url": "https://example.com/pony", "type": "checkpoints"},
+    ],
+}
+SIZES = {
+    "https://example.com/base": 6_000,
+    "https://example.com/vae": 300,
+    "https://example.com/pony": None,
+}
+
+
+class ModelPackCatalogTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = Path(temp_dir.name, "comfy_model_packs.json")
+        self.path.write_text(json.dumps(PACKS))
+        self.catalog = model_packs.ModelPackCatalog(str(self.path))
+
+        self.fetch_manifest = AsyncMock(side_effect=lambda url: MANIFESTS[url])
+        self.fetch_size = AsyncMock(side_effect=lambda url: SIZES[url])
+        for name, mock in [
+            ("_fetch_manifest", self.fetch_manifest),
+            ("_fetch_size", self.fetch_size),
+        ]:
+            patcher = patch.object(model_packs, name, mock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_file_is_parsed_once(self) -> None:
+        first = await self.catalog.get()
+        await self.catalog._expand_task
+
+        with patch.object(self.catalog, "_read") as read:
+            second = await self.catalog.get()
+        read.assert_not_called()
+        self.assertIs(second, await self.catalog.get())
+        self.assertNotEqual(first.etag, second.etag)
+
+    async def test_changed_file_is_reloaded(self) -> None:
+        before = await self.catalog.get()
+        self.path.write_text(json.dumps({"SD": PACKS["SDXL"][:1]}))
+        os.utime(self.path, ns=(0, 0))
+
+        after = await self.catalog.get()
+
+        self.assertNotEqual(after.etag, before.etag)
+        self.assertEqual(list(json.loads(after.body)), ["SD"])
+
+    async def test_packs_are_expanded(self) -> None:
+        await self.catalog.get()
+        await self.catalog._expand_task
+
+        sdxl, pony = json.loads((await self.catalog.get()).body)["SDXL"]
+        self.assertEqual((sdxl["file_count"], sdxl["total_size"]), (2, 6_300))
+        # One size is unknown, so the total is too
+        self.assertEqual((pony["file_count"], pony["total_size"]), (1, None))
+        self.assertEqual(
+            await self.catalog.load_manifest("https://example.com/pony.json"),
+            MANIFESTS["https://example.com/pony.json"],
+        )
+
+        # A reload only fetches what is new
+        os.utime(self.path, ns=(0, 0))
+        await self.catalog.get()
+        await self.catalog._expand_task
+        self.assertEqual(self.fetch_manifest.await_count, 2)
+        self.assertEqual(self.fetch_size.await_count, 3)
+
+    async def test_unreachable_manifest_leaves_the_pack_as_is(self) -> None:
+        self.fetch_manifest.side_effect = OSError("offline")
+
+        await self.catalog.get()
+        await self.catalog._expand_task
+
+        self.assertEqual(json.loads((await self.catalog.get()).body), PACKS)
+
+    async def test_no_catalog(self) -> None:
+        catalog = model_packs.ModelPackCatalog(None)
+
+        self.assertEqual((await catalog.get()).body, b"[]")
+
+    async def test_warm_up_resolves_every_model(self) -> None:
+        fetch_sha256 = AsyncMock(side_effect=lambda url: url[-4:] * 16)
+        with (
+            patch.object(download, "_fetch_expected_sha256", fetch_sha256),
+            patch.object(download, "_get_http_filename", AsyncMock(return_value=None)),
+            patch.object(model_packs, "WARMUP_INTERVAL", 0),
+        ):
+            self.addCleanup(download._source_metadata.clear)
+            await self.catalog.warm_up()
+            self.assertEqual(fetch_sha256.await_count, 3)
+
+            # Preflights and a second warm-up reuse the lookups
+            metadata = await download.resolve_source_metadata(
+                "https://example.com/base"
+            )
+            await self.catalog.warm_up()
+
+        self.assertEqual(metadata.expected_sha256, "base" * 16)
+        self.assertEqual(fetch_sha256.await_count, 3)
+
+
+class SourceMetadataTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.addCleanup(download._source_metadata.clear)
+
+    async def test_concurrent_lookups_are_shared(self) -> None:
+        url = "https://civitai.com/api/download/models/123"
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def fetch_sha256(url):
+            started.set()
+            await release.wait()
+            return "A" * 64
+
+        with (
+            patch.object(download, "_fetch_expected_sha256", fetch_sha256),
+            patch.object(
+                download, "_get_http_filename", AsyncMock(return_value="m.safetensors")
+            ) as get_filename,
+        ):
+            first = asyncio.create_task(download.resolve_source_metadata(url))
+            await started.wait()
+            second = asyncio.create_task(download.resolve_source_metadata(url))
+            # Cancelling one caller leaves the lookup running for the other
+            first.cancel()
+            release.set()
+            metadata = await second
+
+        self.assertEqual(metadata.expected_sha256, "a" * 64)
+        self.assertEqual(metadata.filename, "m.safetensors")
+        get_filename.assert_awaited_once()
+        self.assertIs(download.cached_source_metadata(url), metadata)
+
+    async def test_failed_lookup_is_retried(self) -> None:
+        url = "https://huggingface.co/org/repo/resolve/main/model.safetensors"
+        fetch_sha256 = AsyncMock(side_effect=[None, "b" * 64])
+
+        with patch.object(download, "_fetch_expected_sha256", fetch_sha256):
+            missing = await download.resolve_source_metadata(url)
+            found = await download.resolve_source_metadata(url)
+
+        self.assertIsNone(missing.expected_sha256)
+        self.assertEqual(found.expected_sha256, "b" * 64)
+
+    async def test_entries_expire(self) -> None:
+        url = "https://civitai.com/api/download/models/123"
+        with (
+            patch.object(
+                download, "_fetch_expected_sha256", AsyncMock(return_value="c" * 64)
+            ),
+            patch.object(download, "_get_http_filename", AsyncMock(return_value=None)),
+        ):
+            metadata = await download.resolve_source_metadata(url)
+
+        self.assertIs(download.cached_source_metadata(url), metadata)
+        with patch.object(download, "SOURCE_METADATA_TTL", 0):
+            self.assertIsNone(download.cached_source_metadata(url))
+
+
+class GetModelPacksTests(unittest.TestCase):
+    def test_conditional_request(self) -> None:
+        app = FastAPI()
+        app.include_router(api.router)
+        catalog = model_packs.ModelPackCatalog(None)
+
+        with patch.object(api, "modelPacks", catalog), TestClient(app) as client:
+            response = client.get("/api/get_model_packs")
+            etag = response.headers["etag"]
+            cached = client.get("/api/get_model_packs", headers={"If-None-Match": etag})
+
+        self.assertEqual(response.json(), [])
+        self.assertEqual(response.headers["cache-control"], "no-cache")
+        self.assertEqual(cached.status_code, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+from pathlib import Path
+from unittest.mock import patch
+
+from utils.image_size import read_image_size
+from worker import output_index
+
+
+def _png(width: int, height: int) -> bytes:
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + struct.pack(">I", len(ihdr))
+        + b"IHDR"
+        + ihdr
+        + struct.pack(">I", zlib.crc32(b"IHDR" + ihdr))
+    )
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    exif = b"Exif\0\0" + b"\0" * 100
+    return (
+        b"\xff\xd8"
+        + b"\xff\xe1"
+        + struct.pack(">H", len(exif) + 2)
+        + exif
+        + b"\xff\xc0"
+        + struct.pack(">HBHHB", 11, 8, height, width, 1)
+        + b"\x01\x11\x00"
+    )
+
+
+def _webp(chunk: bytes, payload: bytes) -> bytes:
+    body = b"WEBP" + chunk + struct.pack("<I", len(payload)) + payload
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+class ImageSizeTests(unittest.TestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.dir = Path(temp_dir.name)
+
+    def size_of(self, data: bytes):
+        path = self.dir / "image"
+        path.write_bytes(data)
+        return read_image_size(str(path))
+
+    def test_formats(self) -> None:
+        vp8l_bits = (1023 - 1) | ((768 - 1) << 14)
+        cases = {
+            "png": (_png(1024, 768), (1024, 768)),
+            "jpeg": (_jpeg(832, 1216), (832, 1216)),
+            "gif": (b"GIF89a" + struct.pack("<HH", 64, 32) + b"\0" * 8, (64, 32)),
+            "bmp": (
+                b"BM" + b"\0" * 16 + struct.pack("<ii", 40, -30) + b"\0" * 8,
+                (40, 30),
+            ),
+            "webp lossy": (
+                _webp(
+                    b"VP8 ",
+                    b"\0\0\0\x9d\x01\x2a" + struct.pack("<HH", 512, 512) + b"\0" * 4,
+                ),
+                (512, 512),
+            ),
+            "webp lossless": (
+                _webp(b"VP8L", b"\x2f" + struct.pack("<I", vp8l_bits) + b"\0" * 4),
+                (1023, 768),
+            ),
+            "webp extended": (
+                _webp(
+                    b"VP8X",
+                    b"\0" * 4
+                    + (1919).to_bytes(3, "little")
+                    + (1079).to_bytes(3, "little"),
+                ),
+                (1920, 1080),
+            ),
+        }
+        for name, (data, expected) in cases.items():
+            with self.subTest(name):
+                self.assertEqual(tuple(self.size_of(data)), expected)
+
+    def test_unknown_or_truncated_data(self) -> None:
+        self.assertIsNone(self.size_of(b"not an image"))
+        self.assertIsNone(self.size_of(_jpeg(10, 10)[:60]))
+        self.assertIsNone(read_image_size(str(self.dir / "missing.png")))
+
+
+class OutputIndexQueryTests(unittest.TestCase):
+    def test_sorting_and_pagination(self) -> None:
+        index = output_index.OutputIndex("/nonexistent")
+        index._apply(
+            {
+                name: {"path": name, "size": size, "mtime": mtime}
+                for name, size, mtime in [
+                    ("b.png", 30, 1.0),
+                    ("a.png", 10, 3.0),
+                    ("c.png", 20, 2.0),
+                ]
+            },
+            [],
+        )
+
+        def paths(**kwargs):
+            return [e["path"] for e in index.query(**kwargs)["items"]]
+
+        self.assertEqual(paths(), ["a.png", "c.png", "b.png"])
+        self.assertEqual(paths(sort="name", order="asc"), ["a.png", "b.png", "c.png"])
+        self.assertEqual(paths(sort="size", offset=1, limit=1), ["c.png"])
+        self.assertEqual(paths(offset=5), [])
+        self.assertEqual(index.query()["total"], 3)
+
+
+class OutputIndexMonitorTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = Path(temp_dir.name)
+        (self.root / "old.png").write_bytes(_png(64, 64))
+        self.index = output_index.OutputIndex(str(self.root))
+
+        self.messages: asyncio.Queue = asyncio.Queue()
+
+        async def broadcast(message: str) -> None:
+            self.messages.put_nowait(json.loads(message))
+
+        broadcast_patch = patch.object(output_index.manager, "broadcast", broadcast)
+        broadcast_patch.start()
+        self.addCleanup(broadcast_patch.stop)
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self.index.monitor())
+        self.addAsyncCleanup(self.stop)
+        while not self.index.ready:
+            await asyncio.sleep(0.01)
+
+    async def stop(self) -> None:
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+    async def next_message(self) -> dict:
+        message = await asyncio.wait_for(self.messages.get(), 5)
+        self.assertEqual(message["type"], "outputs")
+        return message["data"]
+
+    async def check_new_and_removed_images(self) -> None:
+        self.assertEqual([e["path"] for e in self.index.query()["items"]], ["old.png"])
+
+        (self.root / "batch").mkdir()
+        (self.root / "batch" / "new.png").write_bytes(_png(832, 1216))
+        (self.root / "notes.txt").write_text("not an image")
+        data = await self.next_message()
+
+        self.assertEqual([e["path"] for e in data["added"]], ["batch/new.png"])
+        self.assertEqual(
+            (data["added"][0]["width"], data["added"][0]["height"]), (832, 1216)
+        )
+        self.assertEqual(self.index.query()["total"], 2)
+
+        os.unlink(self.root / "old.png")
+        data = await self.next_message()
+
+        self.assertEqual(data["removed"], ["old.png"])
+        self.assertEqual(
+            [e["path"] for e in self.index.query()["items"]], ["batch/new.png"]
+        )
+
+    @unittest.skipUnless(output_index.inotify_available(), "inotify is unavailable")
+    async def test_inotify_keeps_the_index_current(self) -> None:
+        await self.start()
+        await self.check_new_and_removed_images()
+
+        os.rename(self.root / "batch", self.root / "moved")
+        added, removed = [], []
+        while not (added and removed):
+            data = await self.next_message()
+            added += [e["path"] for e in data["added"]]
+            removed += data["removed"]
+
+        self.assertEqual((added, removed), (["moved/new.png"], ["batch/new.png"]))
+        self.assertEqual(
+            [e["path"] for e in self.index.query()["items"]], ["moved/new.png"]
+        )
+
+    async def test_polling_keeps_the_index_current(self) -> None:
+        with (
+            patch.object(output_index, "inotify_available", return_value=False),
+            patch.object(output_index, "POLL_INTERVAL", 0.05),
+        ):
+            await self.start()
+            await self.check_new_and_removed_images()
+
+
+if __name__ == "__main__":
+    unittest.main()
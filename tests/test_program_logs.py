@@ -0,0 +1,403 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+from worker import program_logs
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _make_log(temp_dir: str, content: bytes) -> program_logs.ProgramLog:
+    log_path = Path(temp_dir, "program.log")
+    log_path.write_bytes(content)
+    return program_logs.ProgramLog(str(log_path), "COMFY")
+
+
+class ProgramLogQueryTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        content = b"".join(f"line {i}\n".encode() for i in range(10))
+        self.program_log = _make_log(self.temp_dir.name, content)
+        self.seqs = [entry["seq"] for entry in self.program_log.get()]
+
+    def test_sequence_ids_are_line_offsets(self) -> None:
+        self.assertEqual(self.seqs, [i * len(b"line 0\n") for i in range(10)])
+
+    def test_tail_returns_last_lines(self) -> None:
+        lines = self.program_log.get(tail=3)
+
+        self.assertEqual(
+            [entry["m"] for entry in lines], ["line 7", "line 8", "line 9"]
+        )
+
+    def test_since_pages_forward(self) -> None:
+        lines = self.program_log.get(since=self.seqs[2], limit=2)
+
+        self.assertEqual([entry["m"] for entry in lines], ["line 3", "line 4"])
+
+    def test_before_pages_backward(self) -> None:
+        lines = self.program_log.get(before=self.seqs[5], limit=2)
+
+        self.assertEqual([entry["m"] for entry in lines], ["line 3", "line 4"])
+
+    def test_since_and_before_select_a_range(self) -> None:
+        lines = self.program_log.get(since=self.seqs[1], before=self.seqs[4])
+
+        self.assertEqual([entry["m"] for entry in lines], ["line 2", "line 3"])
+
+
+class ProgramLogStartupTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_only_the_tail_is_loaded(self) -> None:
+        content = b"".join(f"line {i:02}\n".encode() for i in range(20))
+
+        with patch.object(program_logs, "LOG_BUFFER_LINES", 5):
+            program_log = _make_log(self.temp_dir.name, content)
+        self.addCleanup(program_log._fp.close)
+
+        self.assertEqual(
+            [entry["m"] for entry in program_log.get()],
+            [f"line {i:02}" for i in range(15, 20)],
+        )
+
+    def test_byte_budget_starts_at_a_line_boundary(self) -> None:
+        content = b"".join(f"line {i:02}\n".encode() for i in range(20))
+
+        with patch.object(program_logs, "LOG_TAIL_BYTES", 20):
+            program_log = _make_log(self.temp_dir.name, content)
+        self.addCleanup(program_log._fp.close)
+
+        self.assertEqual(
+            [entry["m"] for entry in program_log.get()], ["line 18", "line 19"]
+        )
+
+    def test_older_lines_are_read_back_from_the_file(self) -> None:
+        content = b"".join(f"line {i:02}\n".encode() for i in range(20))
+        line_size = len(b"line 00\n")
+
+        with patch.object(program_logs, "LOG_BUFFER_LINES", 5):
+            program_log = _make_log(self.temp_dir.name, content)
+        self.addCleanup(program_log._fp.close)
+        oldest = program_log.get()[0]
+
+        page = program_log.get(before=oldest["seq"], limit=3)
+        tail = program_log.get(tail=8)
+        window = program_log.get(since=11 * line_size, before=14 * line_size, limit=9)
+
+        self.assertEqual(
+            [(e["seq"], e["m"]) for e in page],
+            [(i * line_size, f"line {i:02}") for i in range(12, 15)],
+        )
+        self.assertEqual(
+            [e["m"] for e in tail], [f"line {i:02}" for i in range(12, 20)]
+        )
+        self.assertEqual([e["m"] for e in window], ["line 12", "line 13"])
+
+    def test_import_time_does_not_grow_with_the_log_size(self) -> None:
+        log_path = Path(self.temp_dir.name, "program.log")
+        line = b"[ComfyUI] loaded model weights for a rather long checkpoint name\n"
+        log_path.write_bytes(line * 500_000)
+
+        # What the previous implementation did at import: read every line
+        start = time.perf_counter()
+        with open(log_path, "r", encoding="utf-8", errors="replace") as fp:
+            full_load = [{"t": "", "m": data.strip()} for data in fp.readlines()]
+        full_load_seconds = time.perf_counter() - start
+        del full_load
+
+        script = (
+            "import json, time\n"
+            "import config.load_config, event_handler, log_manager\n"
+            "start = time.perf_counter()\n"
+            "from worker.program_logs import programLog\n"
+            "print(json.dumps({'seconds': time.perf_counter() - start, "
+            "'lines': len(programLog.get())}))\n"
+        )
+        env = dict(
+            os.environ,
+            PROGRAM_LOG=str(log_path),
+            LOG_PATH=str(Path(self.temp_dir.name, "backend.log")),
+            LOG_BUFFER_LINES="1000",
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=REPO_ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        measured = json.loads(result.stdout.strip().splitlines()[-1])
+
+        print(
+            f"\nprogram.log of {log_path.stat().st_size / 1024**2:.0f} MB: "
+            f"import {measured['seconds'] * 1000:.1f} ms, "
+            f"full read {full_load_seconds * 1000:.1f} ms"
+        )
+        self.assertEqual(measured["lines"], 1000)
+        self.assertLess(measured["seconds"], full_load_seconds)
+
+
+class ProgramLogSearchTests(unittest.TestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        lines = [
+            "Starting server",
+            "ERROR: model not found",
+            "torch.OutOfMemoryError: CUDA out of memory",
+            "WARNING: missing node ImpactPack",
+            "Prompt executed in 3.2 seconds",
+            "ERROR: another model not found",
+            "[INFO] loading VAE",
+        ]
+        self.line_seqs = []
+        offset = 0
+        for line in lines:
+            self.line_seqs.append(offset)
+            offset += len(line) + 1
+        content = "".join(f"{line}\n" for line in lines).encode()
+
+        # Only the last three lines are buffered; the rest is on disk
+        with patch.object(program_logs, "LOG_BUFFER_LINES", 3):
+            self.program_log = _make_log(temp_dir.name, content)
+        self.addCleanup(self.program_log._fp.close)
+
+    def test_substring_search_spans_buffer_and_history(self) -> None:
+        page = self.program_log.search("model NOT found")
+
+        self.assertEqual(
+            [(r["seq"], r["m"]) for r in page["results"]],
+            [
+                (self.line_seqs[5], "ERROR: another model not found"),
+                (self.line_seqs[1], "ERROR: model not found"),
+            ],
+        )
+        self.assertEqual(page["results"][0]["matches"], [[15, 30]])
+        self.assertIsNone(page["next_cursor"])
+
+    def test_level_filter_and_pagination(self) -> None:
+        first = self.program_log.search(levels=["error"], limit=2)
+        second = self.program_log.search(
+            levels=["error"], before=first["next_cursor"], limit=2
+        )
+
+        self.assertEqual(
+            [r["seq"] for r in first["results"] + second["results"]],
+            [self.line_seqs[5], self.line_seqs[2], self.line_seqs[1]],
+        )
+        self.assertTrue(all(r["level"] == "error" for r in second["results"]))
+
+    def test_regex_search(self) -> None:
+        page = self.program_log.search(r"missing node (\w+)", regex=True)
+
+        self.assertEqual([r["seq"] for r in page["results"]], [self.line_seqs[3]])
+
+        with self.assertRaises(program_logs.re.error):
+            self.program_log.search("(unclosed", regex=True)
+
+    def test_history_scan_budget_returns_a_cursor(self) -> None:
+        with patch.object(program_logs, "SEARCH_SCAN_BYTES", 1):
+            page = self.program_log.search("ERROR", before=self.line_seqs[4])
+            resumed = self.program_log.search("ERROR", before=page["next_cursor"])
+
+        # One line is checked per call, so each page moves back by one line
+        self.assertEqual(page["results"], [])
+        self.assertEqual(page["next_cursor"], self.line_seqs[3])
+        self.assertEqual([r["seq"] for r in resumed["results"]], [self.line_seqs[2]])
+        self.assertEqual(resumed["next_cursor"], self.line_seqs[2])
+
+    def test_time_range_only_searches_the_buffer(self) -> None:
+        past = program_logs.datetime(2000, 1, 1)
+        future = program_logs.datetime(2100, 1, 1)
+
+        in_range = self.program_log.search("not found", start=past, end=future)
+        too_late = self.program_log.search("not found", start=future)
+
+        self.assertEqual([r["seq"] for r in in_range["results"]], [self.line_seqs[5]])
+        self.assertEqual(too_late["results"], [])
+
+
+class ProgressLineTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.program_log = _make_log(temp_dir.name, b"")
+        self.addCleanup(self.program_log._fp.close)
+
+    def sampling_run(self, steps: int) -> list[bytes]:
+        """Chunks a tqdm progress bar writes during one sampling run."""
+        chunks = [b"got prompt\n"]
+        for step in range(1, steps + 1):
+            bar = "#" * (step * 40 // steps)
+            chunks.append(
+                f"\r{step * 100 // steps:3d}%|{bar:<40}| {step}/{steps}".encode()
+            )
+        chunks.append(b"\nPrompt executed in 4.20 seconds\n")
+        return chunks
+
+    async def test_progress_updates_replace_one_line(self) -> None:
+        broadcast = AsyncMock()
+
+        with patch.object(program_logs.manager, "broadcast", new=broadcast):
+            for chunk in self.sampling_run(30):
+                await self.program_log._broadcast_updates(
+                    self.program_log._ingest(chunk)
+                )
+
+        frames = [json.loads(call.args[0]) for call in broadcast.await_args_list]
+        buffered = self.program_log.get()
+        self.assertEqual(
+            [entry["m"] for entry in buffered],
+            [
+                "got prompt",
+                "100%|" + "#" * 40 + "| 30/30",
+                "Prompt executed in 4.20 seconds",
+            ],
+        )
+        # New lines: prompt, first progress state, completion. The final
+        # progress state replaces the first one; throttled states are skipped.
+        self.assertEqual(
+            [frame["type"] for frame in frames],
+            ["logs", "logs", "logs_replace", "logs"],
+        )
+        self.assertEqual(frames[2]["data"]["seq"], buffered[1]["seq"])
+        self.assertEqual(frames[2]["data"]["m"], buffered[1]["m"])
+
+        # Previously every read of a partial line became its own entry and frame
+        previous_frames = len(self.sampling_run(30))
+        previous_bytes = sum(len(chunk) for chunk in self.sampling_run(30))
+        buffered_bytes = sum(len(entry["m"]) for entry in buffered)
+        self.assertLess(len(frames), previous_frames)
+        self.assertLess(buffered_bytes, previous_bytes / 10)
+
+    async def test_progress_updates_are_throttled_not_dropped(self) -> None:
+        with patch.object(program_logs, "PROGRESS_UPDATE_INTERVAL", 0):
+            self.program_log._ingest(b"\r 10%|#")
+            self.program_log._ingest(b"\r 20%|##")
+            updates = self.program_log._ingest(b"\r 30%|###\r")
+
+        self.assertEqual(
+            [(entry["m"], replaced) for entry, replaced in updates],
+            [("30%|###", True)],
+        )
+        self.assertEqual(len(self.program_log.get()), 1)
+
+    def test_partial_progress_line_is_compacted(self) -> None:
+        for step in range(1000):
+            self.program_log._ingest(f"\r{step:4d}/1000".encode())
+
+        self.assertLess(len(self.program_log._partial), 20)
+
+        self.program_log._ingest(b"\n")
+        entry = self.program_log.get()[0]
+        self.assertEqual((entry["seq"], entry["m"]), (0, "999/1000"))
+
+    def test_history_lines_show_the_last_state(self) -> None:
+        log_path = self.program_log.log_path
+
+        with open(log_path, "wb") as fp:
+            fp.write(b"\r 50%|#\r100%|##\nnext\n")
+        with patch.object(program_logs, "LOG_BUFFER_LINES", 1):
+            reloaded = program_logs.ProgramLog(log_path, "COMFY")
+        self.addCleanup(reloaded._fp.close)
+
+        history = reloaded.get(tail=2)
+        self.assertEqual([entry["m"] for entry in history], ["100%|##", "next"])
+
+
+class ProgramLogTailTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.log_path = Path(self.temp_dir.name, "program.log")
+        self.program_log = _make_log(self.temp_dir.name, b"first\n")
+        self.addCleanup(self.program_log._fp.close)
+
+    def _append(self, data: bytes) -> None:
+        with open(self.log_path, "ab") as fp:
+            fp.write(data)
+
+    async def test_broadcast_sequence_ids_match_buffered_lines(self) -> None:
+        self._append(b"second\n\nthird\n")
+        broadcast = AsyncMock()
+
+        with patch.object(program_logs.manager, "broadcast", new=broadcast):
+            updates, _ = self.program_log._read_changes()
+            await self.program_log._broadcast_updates(updates)
+
+        sent = [json.loads(call.args[0])["data"] for call in broadcast.await_args_list]
+        buffered = self.program_log.get(since=0)
+        self.assertEqual(sent, [{"m": e["m"], "seq": e["seq"]} for e in buffered])
+        self.assertEqual([entry["seq"] for entry in buffered], [6, 14])
+
+    def test_partial_line_is_buffered_until_newline(self) -> None:
+        self._append(b"hal")
+        updates, _ = self.program_log._read_changes()
+        self.assertEqual(updates, [])
+
+        self._append(b"f a line\n")
+        updates, _ = self.program_log._read_changes()
+
+        self.assertEqual([(e["seq"], e["m"]) for e, _ in updates], [(6, "half a line")])
+
+    def test_rotation_is_detected_by_inode(self) -> None:
+        self._append(b"before rotation\n")
+        self.log_path.rename(self.log_path.with_suffix(".log.1"))
+        # Same size as the old file, so only the inode reveals the rotation
+        self.log_path.write_bytes(b"new file\n" + b"x" * 12 + b"\n")
+
+        updates, reopened = self.program_log._read_changes()
+        entries = [entry for entry, _ in updates]
+
+        self.assertTrue(reopened)
+        self.assertEqual(
+            [e["m"] for e in entries], ["before rotation", "new file", "x" * 12]
+        )
+        seqs = [entry["seq"] for entry in self.program_log.get()]
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertEqual(entries[1]["seq"], len(b"first\nbefore rotation\n"))
+
+    def test_truncation_restarts_from_the_beginning(self) -> None:
+        self.log_path.write_bytes(b"")
+        self._append(b"new\n")
+
+        updates, reopened = self.program_log._read_changes()
+
+        self.assertFalse(reopened)
+        self.assertEqual([(e["seq"], e["m"]) for e, _ in updates], [(6, "new")])
+
+    @unittest.skipUnless(program_logs.inotify_available(), "inotify is Linux only")
+    async def test_monitor_delivers_lines_on_inotify_events(self) -> None:
+        received = asyncio.Queue()
+
+        async def broadcast(message: str) -> None:
+            received.put_nowait(json.loads(message)["data"]["m"])
+
+        with (
+            patch.object(program_logs.manager, "broadcast", new=broadcast),
+            patch.object(program_logs, "INOTIFY_SAFETY_INTERVAL", 60),
+        ):
+            task = asyncio.create_task(self.program_log.monitor_log())
+            await asyncio.sleep(0.05)
+            self._append(b"hello\n")
+            message = await asyncio.wait_for(received.get(), 2)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        self.assertEqual(message, "hello")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, Mock, patch
+
+from worker import restart_program
+
+
+class RestartJobsTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.dir = Path(temp_dir.name)
+        self.write_script("stop_process.sh", "echo stopping\necho stopped\n")
+        self.write_script("start_process.sh", "echo starting\n")
+
+        self.broadcast = AsyncMock()
+        self.wait_until_running = AsyncMock()
+        self.refresh = Mock()
+        for target, name, value in [
+            (restart_program, "path_mapping", {"COMFY": str(self.dir)}),
+            (restart_program, "UI_TYPE", "COMFY"),
+            (restart_program.manager, "broadcast", self.broadcast),
+            (
+                restart_program.programStatus,
+                "wait_until_running",
+                self.wait_until_running,
+            ),
+            (restart_program.gpuProbe, "refresh", self.refresh),
+        ]:
+            patcher = patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.jobs = restart_program.RestartJobs()
+
+    def write_script(self, name: str, body: str) -> None:
+        (self.dir / name).write_text(body)
+
+    def messages(self) -> list[dict]:
+        return [
+            json.loads(call.args[0])["data"] for call in self.broadcast.await_args_list
+        ]
+
+    async def test_restart_runs_in_the_background(self) -> None:
+        job = self.jobs.start()
+        self.assertEqual(job.phase, "stopping")
+        # A second request joins the running restart
+        self.assertIs(self.jobs.start(), job)
+
+        await job.task
+
+        self.assertEqual(job.phase, "ready")
+        self.assertEqual(set(job.durations), {"stop", "start", "ready"})
+        self.assertEqual(list(job.output), ["stopping", "stopped", "starting"])
+        self.assertEqual(
+            [(m["phase"], m["line"]) for m in self.messages()],
+            [
+                ("stopping", None),
+                ("stopping", "stopping"),
+                ("stopping", "stopped"),
+                ("starting", None),
+                ("starting", "starting"),
+                ("waiting", None),
+                ("ready", None),
+            ],
+        )
+        self.refresh.assert_called_once()
+        self.assertIs(self.jobs.get(job.id), job)
+        self.assertIsNot(self.jobs.start(), job)
+
+    async def test_phase_timeout_fails_the_job(self) -> None:
+        self.write_script("stop_process.sh", "echo stopping\nexec sleep 30\n")
+
+        with patch.object(restart_program, "STOP_TIMEOUT", 0.5):
+            job = self.jobs.start()
+            await job.task
+
+        self.assertEqual(job.phase, "failed")
+        self.assertIn("stop_process.sh", job.error)
+        self.assertEqual(set(job.durations), set())
+        self.assertEqual(self.messages()[-1]["phase"], "failed")
+        self.refresh.assert_not_called()
+
+    async def test_ui_that_never_comes_up_fails_the_job(self) -> None:
+        self.wait_until_running.side_effect = TimeoutError
+
+        job = self.jobs.start()
+        await job.task
+
+        self.assertEqual(job.phase, "failed")
+        self.assertIn("not ready", job.error)
+        self.assertEqual(set(job.durations), {"stop", "start"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+import static_manager
+from utils.compression import JSONCompressionMiddleware, choose_encoding
+
+
+class StaticSiteTests(unittest.TestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        root = Path(temp_dir.name)
+        web = root / "web"
+        files = {
+            "index.html": b"<html>home</html>",
+            "gallery/index.html": b"<html>gallery</html>",
+            "_next/static/chunks/app-3f2a.js": b"console.log(1)" * 10_000,
+            "favicon.ico": b"\0\0\1\0",
+        }
+        for name, content in files.items():
+            (web / name).parent.mkdir(parents=True, exist_ok=True)
+            (web / name).write_bytes(content)
+        self.site = static_manager.StaticSite(
+            str(root / "web"), Path(temp_dir.name, "cache")
+        )
+        self.site.scan()
+
+        app = FastAPI(docs_url=None, redoc_url=None)
+
+        @app.get("/{full_path:path}")
+        async def serve(full_path: str, request: Request):
+            asset = self.site.lookup(full_path)
+            if asset is None:
+                return static_manager.Response(status_code=404)
+            return self.site.response(asset, request)
+
+        self.client = TestClient(app)
+
+    def test_routes(self) -> None:
+        self.assertEqual(self.client.get("/").content, b"<html>home</html>")
+        self.assertEqual(self.client.get("/gallery").content, b"<html>gallery</html>")
+        self.assertEqual(self.client.get("/gallery/").content, b"<html>gallery</html>")
+        # Unknown pages are left to client-side routing, unknown assets are not
+        self.assertEqual(self.client.get("/models/1").content, b"<html>home</html>")
+        self.assertEqual(self.client.get("/_next/static/missing.js").status_code, 404)
+
+    def test_small_files_are_served_from_memory(self) -> None:
+        shutil.rmtree(self.site.root)
+
+        self.assertEqual(self.client.get("/gallery").content, b"<html>gallery</html>")
+        self.assertEqual(self.client.get("/models/1").content, b"<html>home</html>")
+
+    def test_hashed_assets_are_immutable(self) -> None:
+        response = self.client.get(
+            "/_next/static/chunks/app-3f2a.js", headers={"Accept-Encoding": ""}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"console.log(1)" * 10_000)
+        self.assertIn("immutable", response.headers["cache-control"])
+        self.assertIn("javascript", response.headers["content-type"])
+
+    def test_other_files_are_revalidated(self) -> None:
+        response = self.client.get("/")
+        etag = response.headers["etag"]
+
+        self.assertEqual(response.headers["cache-control"], "no-cache")
+        self.assertEqual(
+            self.client.get("/", headers={"If-None-Match": etag}).status_code, 304
+        )
+        self.assertEqual(
+            self.client.get(
+                "/", headers={"If-Modified-Since": response.headers["last-modified"]}
+            ).status_code,
+            304,
+        )
+        self.assertEqual(
+            self.client.get("/", headers={"If-None-Match": '"stale"'}).status_code,
+            200,
+        )
+
+    def test_text_assets_are_served_precompressed(self) -> None:
+        path = "/_next/static/chunks/app-3f2a.js"
+        plain = self.client.get(path, headers={"Accept-Encoding": "identity"})
+
+        with patch.object(static_manager, "compress") as compress:
+            response = self.client.get(
+                path, headers={"Accept-Encoding": "gzip, deflate"}
+            )
+        compress.assert_not_called()
+
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertLess(int(response.headers["content-length"]), 1000)
+        # httpx decodes the body
+        self.assertEqual(response.content, plain.content)
+        self.assertNotEqual(response.headers["etag"], plain.headers["etag"])
+        self.assertEqual(
+            self.client.get(
+                path,
+                headers={
+                    "Accept-Encoding": "gzip",
+                    "If-None-Match": response.headers["etag"],
+                },
+            ).status_code,
+            304,
+        )
+        # gzip;q=0 refuses gzip
+        refused = self.client.get(path, headers={"Accept-Encoding": "gzip;q=0"})
+        self.assertNotIn("content-encoding", refused.headers)
+
+    def test_variants_are_reused_and_stale_ones_removed(self) -> None:
+        variants = sorted(p.name for p in self.site.cache_dir.iterdir())
+        stale = self.site.cache_dir / "0123.gz"
+        stale.write_bytes(b"old build")
+
+        with patch.object(static_manager, "compress") as compress:
+            self.site.scan()
+
+        compress.assert_not_called()
+        self.assertEqual(
+            sorted(p.name for p in self.site.cache_dir.iterdir()), variants
+        )
+
+
+class JSONCompressionMiddlewareTests(unittest.TestCase):
+    def setUp(self) -> None:
+        app = FastAPI()
+        app.add_middleware(JSONCompressionMiddleware, minimum_size=1024)
+
+        @app.get("/big")
+        async def big():
+            return [{"m": f"line {i}"} for i in range(1000)]
+
+        @app.get("/small")
+        async def small():
+            return {"ok": True}
+
+        @app.get("/text")
+        async def text():
+            return PlainTextResponse("x" * 5000)
+
+        self.client = TestClient(app)
+
+    def test_large_json_is_compressed(self) -> None:
+        response = self.client.get("/big", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertLess(int(response.headers["content-length"]), 5000)
+        self.assertEqual(len(response.json()), 1000)
+
+    def test_other_responses_are_untouched(self) -> None:
+        for path, accept in [
+            ("/small", "gzip"),
+            ("/text", "gzip"),
+            ("/big", "identity"),
+        ]:
+            with self.subTest(path=path, accept=accept):
+                response = self.client.get(path, headers={"Accept-Encoding": accept})
+                self.assertNotIn("content-encoding", response.headers)
+
+    def test_choose_encoding(self) -> None:
+        self.assertEqual(choose_encoding("gzip, br", ("gzip",)), "gzip")
+        self.assertEqual(choose_encoding("*", ("gzip",)), "gzip")
+        self.assertEqual(choose_encoding("gzip;q=0, *", ("gzip",)), "identity")
+        self.assertEqual(choose_encoding(None, ("gzip",)), "identity")
+
+
+if __name__ == "__main__":
+    unittest.main()
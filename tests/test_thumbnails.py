@@ -0,0 +1,113 @@
+import asyncio
+import importlib.util
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+from worker import thumbnails
+
+HAS_PILLOW = importlib.util.find_spec("PIL") is not None
+
+
+def _write_image(path: Path, size: tuple[int, int], color: str = "red") -> None:
+    from PIL import Image
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", size, color).save(path)
+
+
+@unittest.skipUnless(HAS_PILLOW, "Pillow is not installed")
+class ThumbnailCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.output = Path(temp_dir.name, "output")
+        _write_image(self.output / "batch" / "image.png", (1024, 768))
+        self.cache = thumbnails.ThumbnailCache(
+            str(self.output), Path(temp_dir.name, "thumbnails"), 10 * 1024 * 1024
+        )
+
+    def use_counting_thread_pool(self) -> list[str]:
+        """Render in threads so the renders can be counted."""
+        rendered = []
+        render_thumbnail = thumbnails.render_thumbnail
+
+        def render(source, target, size, quality):
+            rendered.append(source)
+            return render_thumbnail(source, target, size, quality)
+
+        render_patch = patch.object(thumbnails, "render_thumbnail", render)
+        render_patch.start()
+        self.addCleanup(render_patch.stop)
+        self.cache._pool = ThreadPoolExecutor(2)
+        self.addCleanup(self.cache._pool.shutdown)
+        return rendered
+
+    async def test_renders_webp_in_the_process_pool(self) -> None:
+        from PIL import Image
+
+        self.addCleanup(lambda: self.cache._pool and self.cache._pool.shutdown())
+
+        path, key = await self.cache.get("batch/image.png", 128)
+
+        with Image.open(path) as image:
+            self.assertEqual(image.format, "WEBP")
+            self.assertEqual(image.size, (128, 96))
+        self.assertEqual(len(key), 32)
+
+    async def test_concurrent_requests_share_one_render(self) -> None:
+        rendered = self.use_counting_thread_pool()
+
+        results = await asyncio.gather(
+            *(self.cache.get("batch/image.png", 128) for _ in range(3))
+        )
+        cached = await self.cache.get("batch/image.png", 128)
+
+        self.assertEqual(len(rendered), 1)
+        self.assertEqual({r for r in results}, {cached})
+
+    async def test_key_follows_content_and_size(self) -> None:
+        self.use_counting_thread_pool()
+        _, key = await self.cache.get("batch/image.png", 128)
+        _, other_size = await self.cache.get("batch/image.png", 256)
+
+        image = self.output / "batch" / "image.png"
+        _write_image(image, (512, 512), "blue")
+        os.utime(image, ns=(1, 1))
+        _, changed = await self.cache.get("batch/image.png", 128)
+
+        self.assertEqual(len({key, other_size, changed}), 3)
+
+    async def test_paths_outside_the_output_folder_are_rejected(self) -> None:
+        (self.output.parent / "secret.png").write_bytes(b"x")
+
+        for path in ["../secret.png", "missing.png", "batch", "/etc/passwd"]:
+            with self.subTest(path):
+                with self.assertRaises(thumbnails.ThumbnailNotFound):
+                    await self.cache.get(path, 128)
+
+    async def test_least_recently_used_thumbnails_are_evicted(self) -> None:
+        self.use_counting_thread_pool()
+        for i in range(4):
+            _write_image(self.output / f"{i}.png", (300, 300), "green")
+        paths = []
+        for i in range(4):
+            path, _ = await self.cache.get(f"{i}.png", 256)
+            os.utime(path, (1000 + i, 1000 + i))
+            paths.append(path)
+        size = paths[0].stat().st_size
+
+        # Touching the oldest makes the second one the eviction candidate
+        await self.cache.get("0.png", 256)
+        self.cache._max_bytes = size * 3
+        remaining = self.cache._evict()
+
+        self.assertEqual([p.exists() for p in paths], [True, False, False, True])
+        self.assertEqual(remaining, size * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
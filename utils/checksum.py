@@ -1,20 +1,39 @@
 import asyncio
 import hashlib
+import time
 
 import httpx
 
+from utils.metrics import LONG_BUCKETS, registry
+from utils.tracing import tracer
+
+HASH_SECONDS = registry.histogram(
+    "sdui_hash_seconds", "Time to sha256 one file", buckets=LONG_BUCKETS
+)
+HASH_BYTES = registry.counter("sdui_hash_bytes_total", "Bytes hashed with sha256")
+
 
 async def compute_sha256(filepath: str) -> str:
     loop = asyncio.get_event_loop()
 
-    def _hash() -> str:
+    def _hash() -> tuple[str, int]:
         sha256 = hashlib.sha256()
+        size = 0
         with open(filepath, "rb") as f:
             for chunk in iter(lambda: f.read(1024 * 1024), b""):
                 sha256.update(chunk)
-        return sha256.hexdigest()
+                size += len(chunk)
+        return sha256.hexdigest(), size
 
-    return await loop.run_in_executor(None, _hash)
+    start = time.perf_counter()
+    with tracer.span("sha256", path=filepath) as span:
+        digest, size = await loop.run_in_executor(None, _hash)
+        if span is not None:
+            span.set(bytes=size)
+    # Recorded here rather than in the executor thread
+    HASH_SECONDS.observe(time.perf_counter() - start)
+    HASH_BYTES.inc(size)
+    return digest
 
 
 async def fetch_hf_sha256(
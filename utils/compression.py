@@ -0,0 +1,110 @@
+import gzip
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Best first; brotli is only offered when the module is installed
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data: bytes, encoding: str, fast: bool = False) -> bytes:
+    """Compress ``data``; ``fast`` trades ratio for speed on per-request work."""
+    if encoding == "br":
+        return brotli.compress(data, quality=4 if fast else 11)
+    return gzip.compress(data, compresslevel=5 if fast else 9, mtime=0)
+
+
+def choose_encoding(accept_encoding: str | None, available: tuple[str, ...]) -> str:
+    """
+    Pick the best of ``available`` that the Accept-Encoding header allows, or
+    "identity".
+    """
+    if not accept_encoding:
+        return "identity"
+
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+
+    for encoding in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+
+class JSONCompressionMiddleware:
+    """
+    Compresses JSON responses of at least ``minimum_size`` bytes.
+
+    Unlike a blanket gzip middleware this leaves alone streamed downloads,
+    images and the frontend's assets, which are either already compressed or
+    served precompressed.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(
+            Headers(scope=scope).get("accept-encoding"), ENCODINGS
+        )
+        if encoding == "identity":
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if (
+                    headers.get("content-type", "").startswith("application/json")
+                    and "content-encoding" not in headers
+                ):
+                    # Held back until the body shows whether compression pays
+                    start = message
+                    return
+                await send(message)
+                return
+
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            held, start = start, None
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # Streamed or small: send as is
+                await send(held)
+                await send(message)
+                return
+
+            body = compress(body, encoding, fast=True)
+            headers = MutableHeaders(raw=held["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(held)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
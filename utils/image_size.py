@@ -0,0 +1,71 @@
+import struct
+from typing import BinaryIO
+
+# Enough for the headers of PNG, GIF, BMP and WebP; JPEG is walked segment by
+# segment since EXIF data may come before the frame header.
+_HEADER_SIZE = 32
+
+
+def _jpeg_size(fp: BinaryIO) -> tuple[int, int] | None:
+    fp.seek(2)
+    while True:
+        marker = fp.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        # Fill bytes may pad a marker
+        while marker[1] == 0xFF:
+            marker = marker[1:] + fp.read(1)
+            if len(marker) < 2:
+                return None
+        code = marker[1]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        if code == 0xD9:
+            return None
+        length_bytes = fp.read(2)
+        if len(length_bytes) < 2:
+            return None
+        (length,) = struct.unpack(">H", length_bytes)
+        # SOF0-SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            frame = fp.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">xHH", frame)
+            return width, height
+        fp.seek(length - 2, 1)
+
+
+def read_image_size(path: str) -> tuple[int, int] | None:
+    """
+    Width and height of a PNG, JPEG, WebP, GIF or BMP image, read from its
+    header without decoding it. None when the format is not recognized.
+    """
+    try:
+        with open(path, "rb") as fp:
+            head = fp.read(_HEADER_SIZE)
+            if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+                return struct.unpack(">II", head[16:24])
+            if head[:2] == b"\xff\xd8":
+                return _jpeg_size(fp)
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                chunk = head[12:16]
+                if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+                    width, height = struct.unpack("<HH", head[26:30])
+                    return width & 0x3FFF, height & 0x3FFF
+                if chunk == b"VP8L" and head[20] == 0x2F:
+                    (bits,) = struct.unpack("<I", head[21:25])
+                    return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+                if chunk == b"VP8X":
+                    width = int.from_bytes(head[24:27], "little") + 1
+                    height = int.from_bytes(head[27:30], "little") + 1
+                    return width, height
+                return None
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                return struct.unpack("<HH", head[6:10])
+            if head[:2] == b"BM" and len(head) >= 26:
+                width, height = struct.unpack("<ii", head[18:26])
+                return width, abs(height)
+    except (OSError, struct.error, IndexError):
+        return None
+    return None
@@ -0,0 +1,34 @@
+import os
+
+
+def render_thumbnail(source: str, target: str, size: int, quality: int) -> int:
+    """
+    Write a WebP thumbnail of ``source`` that fits in ``size`` x ``size`` to
+    ``target`` and return its size in bytes.
+
+    Runs in the thumbnail process pool; kept apart from the backend modules so
+    the worker processes import nothing but Pillow.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        # Lets JPEG decode at a reduced scale instead of full size
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        image.save(tmp_path, "WEBP", quality=quality, method=4)
+    os.replace(tmp_path, target)
+    return os.path.getsize(target)
+
+
+def lower_priority() -> None:
+    """Process pool initializer: yield the CPU to the UI and its GPU feeder."""
+    try:
+        os.nice(10)
+    except OSError:
+        pass
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import httpx
+
+from config.load_config import CACHE_PATH, TRACE_DOWNLOADS, TRACE_OTLP_ENDPOINT
+from log_manager import log
+
+# Traces kept in memory for /api/downloads/{id}/timeline
+MAX_TRACES = 200
+SERVICE_NAME = "sd-ui-manager-backend"
+
+
+class Span:
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+    )
+
+    def __init__(self, trace_id, parent_id, name, attributes, start_ns=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: int | None = None
+        self.attributes = attributes
+        self.error: str | None = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+_current: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Opt-in tracing of a download from the API request to verification.
+
+    Spans follow the request through contextvars, so tasks created while a
+    span is open (the download itself) continue its trace. Outside a trace
+    ``span`` does nothing, which keeps background work such as the model pack
+    warm-up out of the traces and costs one ContextVar lookup when disabled.
+
+    Finished spans are appended to ``path`` as JSON lines and, when
+    ``otlp_endpoint`` is set, posted to it as OTLP/JSON.
+    """
+
+    def __init__(self, enabled: bool, path: str, otlp_endpoint: str = ""):
+        self.enabled = enabled
+        self.path = path
+        self.otlp_endpoint = otlp_endpoint.rstrip("/")
+        self._traces: OrderedDict[str, list[Span]] = OrderedDict()
+        self._by_download: dict[str, str] = {}
+        self._pending: list[Span] = []
+        self._flush_task: asyncio.Task | None = None
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """Start a new trace for one request."""
+        if not self.enabled:
+            yield None
+            return
+        trace_id = os.urandom(16).hex()
+        self._traces[trace_id] = []
+        while len(self._traces) > MAX_TRACES:
+            old_id, _ = self._traces.popitem(last=False)
+            self._by_download = {
+                k: v for k, v in self._by_download.items() if v != old_id
+            }
+        with self._open(Span(trace_id, None, name, attributes)) as span:
+            yield span
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        parent = _current.get()
+        if parent is None:
+            yield None
+            return
+        with self._open(
+            Span(parent.trace_id, parent.span_id, name, attributes)
+        ) as span:
+            yield span
+
+    def add_span(self, name: str, start_ns: int, **attributes) -> None:
+        """Record a span that ended now, for waits measured without a ``with``."""
+        parent = _current.get()
+        if parent is None:
+            return
+        span = Span(parent.trace_id, parent.span_id, name, attributes, start_ns)
+        self._begin(span)
+        self._end(span)
+
+    def link_download(self, download_id: str) -> None:
+        """Make the current trace the timeline of ``download_id``."""
+        span = _current.get()
+        if span is not None:
+            self._by_download[download_id] = span.trace_id
+            span.set(download_id=download_id)
+
+    def timeline(self, download_id: str) -> dict | None:
+        trace_id = self._by_download.get(download_id)
+        spans = self._traces.get(trace_id) if trace_id else None
+        if not spans:
+            return None
+        origin = min(span.start_ns for span in spans)
+        return {
+            "download_id": download_id,
+            "trace_id": trace_id,
+            "spans": [
+                {
+                    "name": span.name,
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "start_ms": (span.start_ns - origin) / 1e6,
+                    # None while the stage is still running
+                    "duration_ms": (
+                        (span.end_ns - span.start_ns) / 1e6 if span.end_ns else None
+                    ),
+                    "attributes": span.attributes,
+                    "error": span.error,
+                }
+                for span in sorted(spans, key=lambda span: span.start_ns)
+            ],
+        }
+
+    @contextmanager
+    def _open(self, span: Span):
+        self._begin(span)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.error = str(exc) or type(exc).__name__
+            raise
+        finally:
+            _current.reset(token)
+            self._end(span)
+
+    def _begin(self, span: Span) -> None:
+        spans = self._traces.get(span.trace_id)
+        if spans is not None:
+            spans.append(span)
+
+    def _end(self, span: Span) -> None:
+        span.end_ns = time.time_ns()
+        self._pending.append(span)
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                # No loop (tests); flush() picks the spans up later
+                pass
+
+    async def flush(self) -> None:
+        # Let the spans ending around the same time go out together
+        await asyncio.sleep(0)
+        spans, self._pending = self._pending, []
+        if not spans:
+            return
+        try:
+            await asyncio.to_thread(self._write, spans)
+        except OSError as exc:
+            log.warning(f"Could not write traces to {self.path}: {exc}")
+        if self.otlp_endpoint:
+            await self._export(spans)
+
+    def _write(self, spans: list[Span]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as fp:
+            for span in spans:
+                fp.write(json.dumps(span.to_dict()) + "\n")
+
+    async def _export(self, spans: list[Span]) -> None:
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": SERVICE_NAME},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "downloads"},
+                            "spans": [span.to_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        try:
+            async with httpx.AsyncClient(timeout=5) as client:
+                r = await client.post(f"{self.otlp_endpoint}/v1/traces", json=body)
+                r.raise_for_status()
+        except httpx.HTTPError as exc:
+            log.warning(f"Could not export traces to {self.otlp_endpoint}: {exc}")
+
+
+tracer = Tracer(
+    TRACE_DOWNLOADS,
+    os.path.join(CACHE_PATH, "traces.jsonl"),
+    TRACE_OTLP_ENDPOINT,
+)
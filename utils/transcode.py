@@ -0,0 +1,69 @@
+import io
+from typing import Literal, NamedTuple
+
+# ComfyUI keeps its metadata in EXIF when it saves WebP: "workflow:<json>" in
+# Make and "prompt:<json>" in Model. A1111 puts "parameters" in UserComment.
+_EXIF_MAKE = 0x010F
+_EXIF_MODEL = 0x0110
+_EXIF_IFD = 0x8769
+_EXIF_USER_COMMENT = 0x9286
+# A JPEG APP1 segment cannot hold more than this
+_JPEG_EXIF_LIMIT = 65533
+
+TRANSCODE_EXTENSIONS = frozenset({".png", ".jpg", ".jpeg", ".webp", ".bmp"})
+FORMAT_EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg"}
+
+
+class TranscodeOptions(NamedTuple):
+    format: Literal["webp", "jpeg"]
+    quality: int
+    max_dim: int | None = None
+
+
+def _metadata_exif(image, text: dict[str, str]):
+    exif = image.getexif()
+    for key, tag in (("workflow", _EXIF_MAKE), ("prompt", _EXIF_MODEL)):
+        if key in text:
+            exif[tag] = f"{key}:{text[key]}"
+    if "parameters" in text:
+        exif.get_ifd(_EXIF_IFD)[_EXIF_USER_COMMENT] = b"UNICODE\0" + text[
+            "parameters"
+        ].encode("utf-16-be")
+    return exif
+
+
+def transcode_image(source: str, options: TranscodeOptions) -> bytes:
+    """
+    Re-encode ``source`` as WebP or JPEG, scaled down to fit ``max_dim``.
+
+    PNG text chunks (ComfyUI workflow and prompt, A1111 parameters) and any
+    existing EXIF are carried over in EXIF. JPEG drops them when they do not
+    fit in its 64 KB EXIF segment.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        text = {k: v for k, v in image.info.items() if isinstance(v, str)}
+        if options.max_dim and options.format == "jpeg":
+            image.draft("RGB", (options.max_dim, options.max_dim))
+        # Rotates the pixels upright and drops the Orientation tag
+        image = ImageOps.exif_transpose(image)
+    exif = _metadata_exif(image, text).tobytes()
+
+    if options.max_dim:
+        image.thumbnail((options.max_dim, options.max_dim), Image.Resampling.LANCZOS)
+
+    params = {"quality": options.quality}
+    if options.format == "jpeg":
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        if len(exif) > _JPEG_EXIF_LIMIT:
+            exif = b""
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    if exif:
+        params["exif"] = exif
+
+    buffer = io.BytesIO()
+    image.save(buffer, options.format.upper(), **params)
+    return buffer.getvalue()
@@ -1,4 +1,4 @@
-from typing import Literal
+from typing import Any, Literal
 
 from pydantic import BaseModel
 
@@ -21,8 +21,18 @@ class DownloadMessage(BaseModel):
     data: DownloadData
 
 
+class ProbeLatency(BaseModel):
+    count: int
+    p50_ms: float
+    p95_ms: float
+    max_ms: float
+    # upper bound in ms -> probes at or below it
+    buckets: dict[str, int]
+
+
 class MonitorData(BaseModel):
     status: str
+    latency: ProbeLatency | None = None
 
 
 class MonitorMessage(BaseModel):
@@ -32,9 +42,40 @@ class MonitorMessage(BaseModel):
 
 class LogData(BaseModel):
     m: str
+    seq: int
 
 
 class LogMessage(BaseModel):
     key: str
     type: Literal["logs"] = "logs"
     data: LogData
+
+
+class LogReplaceMessage(BaseModel):
+    key: str
+    type: Literal["logs_replace"] = "logs_replace"
+    data: LogData
+
+
+class OutputsData(BaseModel):
+    added: list[dict[str, Any]]
+    removed: list[str]
+
+
+class OutputsMessage(BaseModel):
+    type: Literal["outputs"] = "outputs"
+    data: OutputsData
+
+
+class RestartData(BaseModel):
+    id: str
+    phase: Literal["stopping", "starting", "waiting", "ready", "failed"]
+    # one line of script output, or None for a phase change
+    line: str | None = None
+    durations: dict[str, float]
+    error: str | None = None
+
+
+class RestartMessage(BaseModel):
+    type: Literal["restart"] = "restart"
+    data: RestartData
@@ -1,8 +1,32 @@
 import asyncio
+import time
+from bisect import bisect_right
+from collections import deque
 from enum import Enum
 
+import httpx
+
+from config.load_config import UI_READY_PATH
 from event_handler import manager
-from utils.ws_messages import MonitorData, MonitorMessage
+from utils.metrics import registry
+from utils.ws_messages import MonitorData, MonitorMessage, ProbeLatency
+
+# Probes run this often while the UI is starting, backing off to the maximum
+# once its status has settled
+PROBE_MIN_INTERVAL = 0.25
+PROBE_MAX_INTERVAL = 5.0
+PROBE_TIMEOUT = 3.0
+# How long fast probing lasts after startup or a restart if the UI never
+# comes up
+FAST_PROBE_WINDOW = 120.0
+LATENCY_WINDOW = 256
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+PROBE_SECONDS = registry.histogram(
+    "sdui_ui_probe_seconds",
+    "Latency of successful UI status probes",
+    buckets=tuple(ms / 1000 for ms in LATENCY_BUCKETS_MS),
+)
 
 
 class Status(Enum):
@@ -17,6 +41,33 @@ class UIPort(Enum):
     COMFY = 8188
 
 
+class LatencyHistogram:
+    """Latencies of the last ``size`` successful probes."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds * 1000)
+
+    def summary(self) -> ProbeLatency | None:
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+
+        def percentile(q: float) -> float:
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))], 2)
+
+        return ProbeLatency(
+            count=len(samples),
+            p50_ms=percentile(0.5),
+            p95_ms=percentile(0.95),
+            max_ms=round(samples[-1], 2),
+            # Cumulative, like a Prometheus histogram
+            buckets={str(le): bisect_right(samples, le) for le in LATENCY_BUCKETS_MS},
+        )
+
+
 class ProgramStatus:
     MAP_STATUS = {
         Status.NOT_RUNNING: "NOT_RUNNING",
@@ -30,36 +81,101 @@ class ProgramStatus:
         "ZIMAGE": UIPort.ZIMAGE.value,
     }
 
-    def __init__(self):
+    def __init__(self, ready_path: str = UI_READY_PATH):
         self.status = Status.NOT_RUNNING
+        # HTTP path that answers once the UI is ready; a bare TCP connect
+        # is used when empty
+        self.ready_path = ready_path
+        self.latency = LatencyHistogram()
+        self._fast_until = 0.0
+        self._wake = asyncio.Event()
+        # Replaced after every probe; see wait_until_running
+        self._probed = asyncio.Event()
+        self._last_probe_at = 0.0
 
     def get_status(self):
         return self.MAP_STATUS[self.status]
 
-    async def ping_check(self, host="127.0.0.1", port=UIPort.COMFY):
-        temp = Status.NOT_RUNNING
-
-        while True:
-            try:
-                reader, writer = await asyncio.open_connection(host, port)
+    def expect_restart(self) -> None:
+        """Probe fast until the UI is back up, e.g. while it restarts."""
+        self._fast_until = time.monotonic() + FAST_PROBE_WINDOW
+        self._wake.set()
+
+    async def wait_until_running(self, timeout: float) -> None:
+        """
+        Wait until a probe started after this call finds the UI running, so a
+        status from before a restart does not count. Needs ping_check to be
+        running; raises TimeoutError after ``timeout`` seconds.
+        """
+        since = time.monotonic()
+        async with asyncio.timeout(timeout):
+            while not (self.status == Status.RUNNING and self._last_probe_at >= since):
+                await self._probed.wait()
+
+    async def probe(self, host: str, port: int) -> Status:
+        start = time.perf_counter()
+        try:
+            if self.ready_path:
+                async with httpx.AsyncClient(timeout=PROBE_TIMEOUT) as client:
+                    r = await client.get(f"http://{host}:{port}{self.ready_path}")
+                if r.status_code >= 400:
+                    return Status.NOT_RUNNING
+            else:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, port), PROBE_TIMEOUT
+                )
                 writer.close()
                 await writer.wait_closed()
+        except (OSError, asyncio.TimeoutError, httpx.HTTPError):
+            return Status.NOT_RUNNING
 
-                temp = Status.RUNNING
+        elapsed = time.perf_counter() - start
+        self.latency.observe(elapsed)
+        PROBE_SECONDS.observe(elapsed)
+        return Status.RUNNING
 
-            except (ConnectionRefusedError, OSError):
-                temp = Status.NOT_RUNNING
+    def _next_interval(self, interval: float) -> float:
+        if time.monotonic() < self._fast_until:
+            return PROBE_MIN_INTERVAL
+        return min(interval * 2, PROBE_MAX_INTERVAL)
+
+    async def ping_check(self, host="127.0.0.1", port=UIPort.COMFY):
+        self._fast_until = time.monotonic() + FAST_PROBE_WINDOW
+        interval = PROBE_MIN_INTERVAL
+
+        while True:
+            probe_at = time.monotonic()
+            temp = await self.probe(host, port)
 
             if temp != self.status:
                 self.status = temp
+                if temp == Status.RUNNING:
+                    # Up again: back off from here
+                    self._fast_until = 0.0
+                interval = PROBE_MIN_INTERVAL
 
                 send = MonitorMessage(
-                    data=MonitorData(status=self.MAP_STATUS[self.status])
+                    data=MonitorData(
+                        status=self.MAP_STATUS[self.status],
+                        latency=self.latency.summary(),
+                    )
                 )
 
                 await manager.broadcast(send.model_dump_json())
+            else:
+                interval = self._next_interval(interval)
 
-            await asyncio.sleep(5)
+            self._last_probe_at = probe_at
+            self._probed.set()
+            self._probed = asyncio.Event()
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                interval = PROBE_MIN_INTERVAL
 
 
 programStatus = ProgramStatus()
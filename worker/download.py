@@ -5,11 +5,11 @@ import re
 import shutil
 import sys
 import tempfile
+import time
 import urllib.parse as urlparse
 from email.message import Message
 from typing import Literal
 
-import httpx
 from curl_cffi.requests import AsyncSession
 from pydantic import BaseModel, ConfigDict
 
@@ -20,6 +20,8 @@ from history_manager import downloadHistory
 from log_manager import log
 from utils.checksum import compute_sha256, fetch_civitai_sha256, fetch_hf_sha256
 from utils.enums import DownloadStatus
+from utils.metrics import LONG_BUCKETS, registry
+from utils.tracing import tracer
 from utils.ws_messages import DownloadData, DownloadMessage
 
 PYTHON = sys.executable
@@ -28,6 +30,40 @@ semaphore = asyncio.Semaphore(5)
 preflight_semaphore = asyncio.Semaphore(5)
 active_download_tasks: set[asyncio.Task[bool]] = set()
 
+# Checksums and file names looked up for a source url are reused this long
+SOURCE_METADATA_TTL = 6 * 60 * 60
+
+DOWNLOAD_BYTES = registry.counter(
+    "sdui_download_bytes_total",
+    "Bytes of completed downloads whose file name is known",
+    ("host", "engine"),
+)
+DOWNLOADS = registry.counter(
+    "sdui_downloads_total",
+    "Finished downloads by result",
+    ("host", "engine", "result"),
+)
+DOWNLOAD_RUN_SECONDS = registry.histogram(
+    "sdui_download_run_seconds",
+    "Time from leaving the queue to the end of a download",
+    ("host", "engine"),
+    buckets=LONG_BUCKETS,
+)
+DOWNLOAD_QUEUE_WAIT_SECONDS = registry.histogram(
+    "sdui_download_queue_wait_seconds",
+    "Time a download waited for one of the download slots",
+    buckets=(0.1, *LONG_BUCKETS),
+)
+DOWNLOADS_QUEUED = registry.gauge(
+    "sdui_downloads_queued", "Downloads waiting for a download slot"
+)
+DOWNLOADS_ACTIVE = registry.gauge("sdui_downloads_active", "Downloads running")
+PREFLIGHT_SECONDS = registry.histogram(
+    "sdui_preflight_seconds",
+    "Checksum lookups (sha256) and HEAD requests (head) made before downloading",
+    ("kind", "host"),
+)
+
 CIVITAI_HOSTS = frozenset({"civitai.com", "civitai.red"})
 HUGGINGFACE_HOSTS = frozenset({"huggingface.co"})
 
@@ -54,6 +90,54 @@ class DownloadPreparation(BaseModel):
     file_matches_sha256: bool
 
 
+class SourceMetadata(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    expected_sha256: str | None
+    filename: str | None
+    fetched_at: float
+
+
+class _DownloadRun:
+    """Queue and run metrics of one download_async call."""
+
+    def __init__(self, url: str):
+        self.host = urlparse.urlparse(url).hostname or ""
+        self.engine = "unknown"
+        self.queued_at = time.monotonic()
+        self.queued_ns = time.time_ns()
+        self.started_at: float | None = None
+        DOWNLOADS_QUEUED.inc()
+
+    def start(self) -> None:
+        self.started_at = time.monotonic()
+        DOWNLOADS_QUEUED.dec()
+        DOWNLOADS_ACTIVE.inc()
+        DOWNLOAD_QUEUE_WAIT_SECONDS.observe(self.started_at - self.queued_at)
+        tracer.add_span("semaphore_wait", self.queued_ns)
+
+    def record_bytes(self, filepath: str) -> None:
+        try:
+            size = os.path.getsize(filepath)
+        except OSError:
+            return
+        DOWNLOAD_BYTES.inc(size, host=self.host, engine=self.engine)
+
+    def finish(self, ok: bool) -> None:
+        if self.started_at is None:
+            DOWNLOADS_QUEUED.dec()
+            return
+        DOWNLOADS_ACTIVE.dec()
+        DOWNLOAD_RUN_SECONDS.observe(
+            time.monotonic() - self.started_at, host=self.host, engine=self.engine
+        )
+        DOWNLOADS.inc(
+            host=self.host,
+            engine=self.engine,
+            result="completed" if ok else "failed",
+        )
+
+
 class QueueDownloadResult(BaseModel):
     model_config = ConfigDict(frozen=True, arbitrary_types_allowed=True)
 
@@ -81,6 +165,13 @@ def _get_download_destination(model_type: str) -> tuple[str, str]:
     return destination_type, os.path.join(RESOURCE_PATH, destination_type)
 
 
+def is_supported_model(model: dict) -> bool:
+    """Whether a resource_list entry can be installed for ``UI_TYPE``."""
+    return not (
+        UI_TYPE == "INVOKEAI" and model["type"] in ["text_encoders", "clip", "vae"]
+    )
+
+
 def _get_civitai_headers() -> dict[str, str]:
     token = getattr(envs, "CIVITAI_TOKEN", "")
     return {"Authorization": f"Bearer {token}"} if token else {}
@@ -142,6 +233,64 @@ async def _get_http_filename(
         return None
 
 
+_source_metadata: dict[str, SourceMetadata] = {}
+_source_metadata_tasks: dict[str, asyncio.Task[SourceMetadata]] = {}
+
+
+async def _fetch_source_metadata(url: str) -> SourceMetadata:
+    hostname = urlparse.urlparse(url).hostname or ""
+    with (
+        PREFLIGHT_SECONDS.time(kind="sha256", host=hostname),
+        tracer.span("fetch_sha256", host=hostname),
+    ):
+        expected_sha256 = await _fetch_expected_sha256(url)
+    if expected_sha256:
+        expected_sha256 = expected_sha256.lower()
+
+    filename = None
+    if expected_sha256 and hostname in CIVITAI_HOSTS:
+        with (
+            PREFLIGHT_SECONDS.time(kind="head", host=hostname),
+            tracer.span("head", host=hostname),
+        ):
+            filename = await _get_http_filename(url, _get_civitai_headers())
+
+    metadata = SourceMetadata(
+        expected_sha256=expected_sha256,
+        filename=filename,
+        fetched_at=time.monotonic(),
+    )
+    # A failed lookup is not cached, so the next preflight tries again
+    if expected_sha256:
+        _source_metadata[url] = metadata
+    return metadata
+
+
+def cached_source_metadata(url: str) -> SourceMetadata | None:
+    metadata = _source_metadata.get(url)
+    if metadata and time.monotonic() - metadata.fetched_at < SOURCE_METADATA_TTL:
+        return metadata
+    return None
+
+
+async def resolve_source_metadata(url: str) -> SourceMetadata:
+    """
+    The source checksum (and CivitAI file name) for ``url``, cached so that the
+    model pack warm-up and later preflights share one lookup.
+    """
+    metadata = cached_source_metadata(url)
+    if metadata is not None:
+        return metadata
+
+    task = _source_metadata_tasks.get(url)
+    if task is None:
+        task = asyncio.create_task(_fetch_source_metadata(url))
+        _source_metadata_tasks[url] = task
+        task.add_done_callback(lambda _: _source_metadata_tasks.pop(url, None))
+    # A cancelled caller must not cancel the lookup others are waiting on
+    return await asyncio.shield(task)
+
+
 async def _existing_file_matches_sha256(
     destination: str, filename: str | None, expected_sha256: str | None
 ) -> bool:
@@ -179,18 +328,14 @@ async def prepare_download(
     destination_type, destination = _get_download_destination(model_type)
     await asyncio.to_thread(os.makedirs, destination, exist_ok=True)
 
-    expected_sha256 = await _fetch_expected_sha256(url)
-    if expected_sha256:
-        expected_sha256 = expected_sha256.lower()
+    metadata = await resolve_source_metadata(url)
+    expected_sha256 = metadata.expected_sha256
     cache_key = expected_sha256 or hashlib.sha256(url.encode("utf-8")).hexdigest()
 
-    parsed_url = urlparse.urlparse(url)
-    hostname = parsed_url.hostname or ""
-    filename = None
+    hostname = urlparse.urlparse(url).hostname or ""
+    filename = metadata.filename
 
-    if expected_sha256 and hostname in CIVITAI_HOSTS:
-        filename = await _get_http_filename(url, _get_civitai_headers())
-    elif expected_sha256 and hostname in HUGGINGFACE_HOSTS:
+    if expected_sha256 and hostname in HUGGINGFACE_HOSTS:
         filename = _get_huggingface_filename(
             url, name, destination_type, cache_key, from_model_pack
         )
@@ -426,13 +571,18 @@ async def _download_http(
 ) -> str:
     # HEAD with default agent to check auth/response before downloading
     content_length = 0
+    hostname = urlparse.urlparse(url).hostname or ""
     try:
         async with AsyncSession() as session:
-            head = await session.head(
-                url,
-                headers=headers or {},
-                allow_redirects=True,
-            )
+            with (
+                PREFLIGHT_SECONDS.time(kind="head", host=hostname),
+                tracer.span("head", host=hostname),
+            ):
+                head = await session.head(
+                    url,
+                    headers=headers or {},
+                    allow_redirects=True,
+                )
             try:
                 if head.status_code == 401:
                     raise RuntimeError(
@@ -575,7 +725,9 @@ async def _download_http(
                 )
             print(f"Checksum verified: {filename}", flush=True)
 
+        size = os.path.getsize(body_path)
         await asyncio.to_thread(os.replace, body_path, filepath)
+        DOWNLOAD_BYTES.inc(size, host=hostname, engine="curl")
         return filename
 
 
@@ -583,7 +735,9 @@ async def queue_download(
     name: str, url: str, model_type: str, from_model_pack: bool = False
 ) -> QueueDownloadResult:
     """Validate a download, update history, and start it only when needed."""
-    preparation = await prepare_download(name, url, model_type, from_model_pack)
+    with tracer.span("prepare_download"):
+        preparation = await prepare_download(name, url, model_type, from_model_pack)
+    tracer.link_download(preparation.cache_key)
     existing = await downloadHistory.get_by_id(preparation.cache_key)
 
     if existing:
@@ -681,8 +835,33 @@ async def download_async(
     from_model_pack: bool = False,
     expected_sha256: str | None = None,
     filename: str | None = None,
+) -> bool:
+    run = _DownloadRun(url)
+    ok = False
+    try:
+        with tracer.span("download", name=name) as span:
+            ok = await _download_async(
+                run, id, name, url, t, from_model_pack, expected_sha256, filename
+            )
+            if span is not None:
+                span.set(engine=run.engine, ok=ok)
+    finally:
+        run.finish(ok)
+    return ok
+
+
+async def _download_async(
+    run: _DownloadRun,
+    id: str,
+    name: str,
+    url: str,
+    t: str,
+    from_model_pack: bool,
+    expected_sha256: str | None,
+    filename: str | None,
 ) -> bool:
     async with semaphore:
+        run.start()
         type_name = t
         original_url = str(url)
         start = _download_message(
@@ -710,14 +889,16 @@ async def download_async(
 
         # CivitAI needs cURL. Hugging Face continues through aria2c below.
         if hostname in CIVITAI_HOSTS:
+            run.engine = "curl"
             try:
-                await _download_http(
-                    url,
-                    destination,
-                    filename=filename,
-                    headers=_get_civitai_headers(),
-                    expected_sha256=expected_sha256,
-                )
+                with tracer.span("engine", engine=run.engine):
+                    await _download_http(
+                        url,
+                        destination,
+                        filename=filename,
+                        headers=_get_civitai_headers(),
+                        expected_sha256=expected_sha256,
+                    )
                 await downloadHistory.update_status(id, DownloadStatus.COMPLETED)
                 res = _download_message(
                     id,
@@ -768,6 +949,7 @@ async def download_async(
             subprocess_env = os.environ.copy()
             if getattr(envs, "HUGGINGFACE_TOKEN", ""):
                 subprocess_env["HF_TOKEN"] = envs.HUGGINGFACE_TOKEN
+            run.engine = "hf"
             log.info("Using hf CLI for Hugging Face download")
         else:
             aria2_cmd = [
@@ -803,6 +985,7 @@ async def download_async(
                 log.warning(f"{fallback_reason}; falling back to aria2c")
 
             cmd = aria2_cmd
+            run.engine = "aria2c"
 
         # if it's a Google Drive link, delegate to your google_drive_download script
         if hostname == "drive.google.com":
@@ -816,10 +999,12 @@ async def download_async(
                 url,
             ]
             cmd = gd_cmd
+            run.engine = "gdown"
 
         log.info(f"executing command: {_redact_command(cmd)}")
 
         # create subprocess, redirecting stdout/stderr
+        engine_start_ns = time.time_ns()
         try:
             proc = await asyncio.create_subprocess_exec(
                 *cmd,
@@ -866,6 +1051,9 @@ async def download_async(
 
         return_code = await proc.wait()
         failure_reason = f"exit code {return_code}"
+        tracer.add_span(
+            "engine", engine_start_ns, engine=run.engine, return_code=return_code
+        )
 
         if (
             return_code == 0
@@ -920,6 +1108,8 @@ async def download_async(
                     )
                     return False
 
+            if filename:
+                run.record_bytes(os.path.join(destination, filename))
             await downloadHistory.update_status(id, DownloadStatus.COMPLETED)
             await manager.broadcast(res.model_dump_json())
             log.info(f"Download completed: {name}")
@@ -933,19 +1123,18 @@ async def download_async(
 
 
 async def download_multiple(packs):
+    # model_packs imports this module
+    from worker.model_packs import MANIFEST_TTL, modelPacks
+
     dl_lst = []
 
     for j in packs:
         log.info(f"Start download {j['name']}")
 
-        async with httpx.AsyncClient() as client:
-            r = await client.get(str(j["url"]), follow_redirects=True)
-
         models_to_queue = []
-        for i in r.json():
-            if (UI_TYPE == "INVOKEAI") and (
-                i["type"] in ["text_encoders", "clip", "vae"]
-            ):
+        # The pack's resource_list is usually cached by the catalog already
+        for i in await modelPacks.load_manifest(str(j["url"]), max_age=MANIFEST_TTL):
+            if not is_supported_model(i):
                 log.warning(
                     f"download {i['name']} skip because InvokeAI does not support"
                 )
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO
+
+from config.load_config import CACHE_PATH, EXPORT_CACHE_BYTES
+from log_manager import log
+from utils.transcode import TranscodeOptions
+from worker.export_zip import (
+    STREAM_CHUNK_SIZE,
+    ExportMember,
+    ZipStreamWriter,
+    _ChunkedSink,
+    _write_members,
+)
+
+
+def export_fingerprint(
+    members: list[ExportMember],
+    level: int,
+    transcode: TranscodeOptions | None = None,
+) -> str:
+    """Identifies an archive by its members' paths, sizes and mtimes."""
+    digest = hashlib.sha256(f"level={level}\ntranscode={transcode!r}\n".encode())
+    for member in members:
+        digest.update(f"{member.arcname}\0{member.size}\0{member.mtime!r}\n".encode())
+    return digest.hexdigest()[:32]
+
+
+class _Build:
+    def __init__(self, key: str, part_path: Path):
+        self.key = key
+        self.part_path = part_path
+        self.done = False
+        self.error: BaseException | None = None
+        self.changed = asyncio.Event()
+        self.task: asyncio.Task[None] | None = None
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class ExportCache:
+    """
+    Keeps finished export archives on disk, keyed by export_fingerprint().
+
+    A build runs to completion even if its client disconnects, and every
+    request for the same fingerprint reads the archive while it is written,
+    so a retry or a second tab never compresses the same files twice.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self._dir = cache_dir
+        self._max_bytes = max_bytes
+        self._builds: dict[str, _Build] = {}
+        self._cleaned = False
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_bytes > 0
+
+    def _archive_path(self, key: str) -> Path:
+        return self._dir / f"{key}.zip"
+
+    def lookup(self, key: str) -> Path | None:
+        """Path of the finished archive for ``key``, if it is cached."""
+        if key in self._builds:
+            return None
+        path = self._archive_path(key)
+        try:
+            # The mtime orders archives for eviction, least recently used first
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def stream(
+        self,
+        key: str,
+        members: list[ExportMember],
+        level: int,
+        transcode: TranscodeOptions | None = None,
+    ) -> AsyncIterator[bytes]:
+        """Stream the archive for ``key``, joining or starting its build."""
+        build = self._builds.get(key)
+        if build is None:
+            build = self._start_build(key, members, level, transcode)
+        # Opened before the build can rename it; the descriptor stays valid
+        return self._follow(build, open(build.part_path, "rb"))
+
+    def _start_build(
+        self,
+        key: str,
+        members: list[ExportMember],
+        level: int,
+        transcode: TranscodeOptions | None,
+    ) -> _Build:
+        if not self._cleaned:
+            # Partial archives left behind by a previous process
+            self._dir.mkdir(parents=True, exist_ok=True)
+            for part_path in self._dir.glob("*.zip.part"):
+                part_path.unlink(missing_ok=True)
+            self._cleaned = True
+
+        build = _Build(key, self._archive_path(key).with_suffix(".zip.part"))
+        # Created up front so followers can open it straight away
+        build.part_path.touch()
+        self._builds[key] = build
+        build.task = asyncio.create_task(
+            self._run_build(build, members, level, transcode)
+        )
+        return build
+
+    async def _run_build(
+        self,
+        build: _Build,
+        members: list[ExportMember],
+        level: int,
+        transcode: TranscodeOptions | None,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+
+        def write() -> None:
+            with open(build.part_path, "wb") as fp:
+
+                def put(chunk: bytes) -> None:
+                    fp.write(chunk)
+                    fp.flush()
+                    loop.call_soon_threadsafe(build.notify)
+
+                sink = _ChunkedSink(put)
+                writer = ZipStreamWriter(sink.write)
+                _write_members(writer, members, level, transcode)
+                writer.close()
+                sink.flush()
+            os.replace(build.part_path, self._archive_path(build.key))
+
+        try:
+            await asyncio.to_thread(write)
+        except BaseException as e:
+            build.error = e
+            log.error(f"Export build {build.key} failed: {e}")
+            build.part_path.unlink(missing_ok=True)
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            build.done = True
+            del self._builds[build.key]
+            build.notify()
+
+        if build.error is None:
+            await asyncio.to_thread(self._evict, build.key)
+
+    async def _follow(self, build: _Build, fp: BinaryIO) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                # Both are captured before reading so nothing written in
+                # between can be missed
+                changed = build.changed
+                done = build.done
+                chunk = await asyncio.to_thread(fp.read, STREAM_CHUNK_SIZE * 4)
+                if chunk:
+                    yield chunk
+                elif build.error is not None:
+                    raise RuntimeError(f"Export build failed: {build.error}")
+                elif done:
+                    break
+                else:
+                    await changed.wait()
+        finally:
+            await asyncio.to_thread(fp.close)
+
+    def _evict(self, keep: str) -> None:
+        """Remove least recently used archives until the cache fits its budget."""
+        archives = []
+        for path in self._dir.glob("*.zip"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            archives.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in archives)
+        for _, size, path in sorted(archives):
+            if total <= self._max_bytes:
+                break
+            if path.stem == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+            log.info(f"Evicted cached export {path.name}")
+
+
+exportCache = ExportCache(Path(CACHE_PATH) / "exports", EXPORT_CACHE_BYTES)
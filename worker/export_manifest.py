@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from config.load_config import CACHE_PATH
+from log_manager import log
+
+MANIFEST_FILE = "exports.json"
+# Only the most recent exports are remembered
+MAX_EXPORTS = 20
+
+
+class ExportManifest:
+    """
+    Remembers recent image exports so a client can ask for only the files
+    that changed since one of them (``?since=<export_id>`` or ``since=last``).
+    """
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._exports: list[dict[str, Any]] | None = None
+
+    def _load(self) -> list[dict[str, Any]]:
+        if self._exports is None:
+            try:
+                with open(self._path, "r", encoding="utf-8") as fp:
+                    self._exports = json.load(fp)["exports"]
+            except FileNotFoundError:
+                self._exports = []
+            except (ValueError, KeyError, TypeError) as e:
+                log.warning(f"Ignoring unreadable export manifest {self._path}: {e}")
+                self._exports = []
+        return self._exports
+
+    def _save(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path.with_name(self._path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump({"exports": self._exports}, fp)
+        os.replace(tmp_path, self._path)
+
+    def list(self) -> list[dict[str, Any]]:
+        """Recent exports, newest first."""
+        with self._lock:
+            return list(reversed(self._load()))
+
+    def resolve_since(self, since: str) -> float:
+        """
+        Turn ``since`` into a unix timestamp. Accepts ``last``, an export id, a
+        unix timestamp in seconds or milliseconds, or an ISO 8601 datetime.
+        Raises ValueError when it is none of these.
+        """
+        with self._lock:
+            exports = self._load()
+            if since == "last":
+                if not exports:
+                    raise ValueError("No previous export")
+                return exports[-1]["started_at"]
+            for export in exports:
+                if export["id"] == since:
+                    return export["started_at"]
+
+        try:
+            timestamp = float(since)
+        except ValueError:
+            pass
+        else:
+            # The frontend works with millisecond timestamps
+            return timestamp / 1000 if timestamp > 1e11 else timestamp
+
+        try:
+            return datetime.fromisoformat(since).timestamp()
+        except ValueError:
+            raise ValueError(f"Unknown export id or timestamp: {since}")
+
+    def record(
+        self,
+        export_id: str,
+        started_at: float,
+        since: float | None,
+        file_count: int,
+        total_size: int,
+    ) -> None:
+        """Remember a finished export; ``started_at`` is when its scan began."""
+        with self._lock:
+            exports = self._load()
+            exports.append(
+                {
+                    "id": export_id,
+                    "started_at": started_at,
+                    "finished_at": time.time(),
+                    "since": since,
+                    "file_count": file_count,
+                    "total_size": total_size,
+                }
+            )
+            del exports[:-MAX_EXPORTS]
+            try:
+                self._save()
+            except OSError as e:
+                log.warning(f"Could not write export manifest {self._path}: {e}")
+
+
+exportManifest = ExportManifest(Path(CACHE_PATH) / MANIFEST_FILE)
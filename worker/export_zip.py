@@ -1,24 +1,529 @@
 import asyncio
+import multiprocessing
 import os
-import zipfile
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from typing import AsyncIterator, Callable, NamedTuple
+from zipfile import ZIP64_LIMIT, ZIP_DEFLATED, ZIP_STORED
 
+from config.load_config import EXPORT_COMPRESS_LEVEL
+from log_manager import log
+from utils.transcode import (
+    FORMAT_EXTENSIONS,
+    TRANSCODE_EXTENSIONS,
+    TranscodeOptions,
+    transcode_image,
+)
 
-async def _create_zip_file(output_dir: Path, temp_zip_path: str) -> None:
+READ_SIZE = 1024 * 1024
+# Size of the chunks handed to the HTTP response and how many of them may be
+# waiting in memory while the client is slower than the archive builder.
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_QUEUE_SIZE = 8
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_DATA_DESCRIPTOR = struct.Struct("<IIII")
+_DATA_DESCRIPTOR64 = struct.Struct("<IIQQ")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_RECORD = struct.Struct("<IHHHHIIH")
+_END_RECORD64 = struct.Struct("<IQHHIIQQQQ")
+_END_LOCATOR64 = struct.Struct("<IIQI")
+
+# Formats that are already compressed; deflating them costs CPU for no gain
+STORED_EXTENSIONS = frozenset(
+    {
+        ".png",
+        ".jpg",
+        ".jpeg",
+        ".webp",
+        ".avif",
+        ".gif",
+        ".mp4",
+        ".webm",
+        ".mov",
+        ".zip",
+        ".gz",
+        ".7z",
+        ".safetensors",
+    }
+)
+# Members up to this size are deflated in parallel, in memory, ahead of the
+# writer; larger ones are compressed while they are streamed.
+PARALLEL_COMPRESS_MAX_SIZE = 8 * 1024 * 1024
+COMPRESS_WORKERS = os.cpu_count() or 1
+
+_transcode_pool: ProcessPoolExecutor | None = None
+
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_UNIX_FILE_ATTR = 0o100644 << 16
+
+
+class ExportMember(NamedTuple):
+    path: str
+    arcname: str
+    size: int
+    mtime: float
+
+
+class _CentralEntry(NamedTuple):
+    arcname: bytes
+    method: int
+    dos_time: int
+    dos_date: int
+    crc: int
+    compressed_size: int
+    size: int
+    offset: int
+    zip64: bool
+    flags: int = _FLAG_DATA_DESCRIPTOR
+
+
+class _Compressed(NamedTuple):
+    crc: int
+    size: int
+    data: bytes
+
+
+class _ExportCancelled(Exception):
+    pass
+
+
+def _scan_output_files(
+    output_dir: Path, since: float | None = None
+) -> list[ExportMember]:
+    """
+    List the files below ``output_dir`` in a stable order, optionally only
+    those created or modified at or after the unix timestamp ``since``.
+    """
+    members = []
+    for root, dirs, files in os.walk(output_dir):
+        dirs.sort()
+        for file in sorted(files):
+            file_path = Path(root) / file
+            try:
+                st = file_path.stat()
+            except FileNotFoundError:
+                continue
+            # ctime also catches files copied in with an older mtime
+            if since is not None and max(st.st_mtime, st.st_ctime) < since:
+                continue
+            # Calculate relative path from output_dir
+            arcname = file_path.relative_to(output_dir).as_posix()
+            members.append(
+                ExportMember(str(file_path), arcname, st.st_size, st.st_mtime)
+            )
+    return members
+
+
+def _compress_type(member: ExportMember, level: int) -> int:
+    if level == 0 or os.path.splitext(member.arcname)[1].lower() in STORED_EXTENSIONS:
+        return ZIP_STORED
+    return ZIP_DEFLATED
+
+
+def _deflate_file(path: str, level: int) -> _Compressed:
+    with open(path, "rb") as fp:
+        data = fp.read()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return _Compressed(
+        zlib.crc32(data), len(data), compressor.compress(data) + compressor.flush()
+    )
+
+
+def _dos_datetime(mtime: float) -> tuple[int, int]:
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+class ZipStreamWriter:
+    """
+    Writes a ZIP archive strictly sequentially, so it can be sent while it is
+    being built. Sizes and CRCs follow each member in a data descriptor, and
+    ZIP64 records are used once sizes, offsets or the entry count need them.
+    """
+
+    def __init__(self, write: Callable[[bytes], None]):
+        self._write = write
+        self._offset = 0
+        self._entries: list[_CentralEntry] = []
+
+    def _emit(self, data: bytes) -> None:
+        self._write(data)
+        self._offset += len(data)
+
+    def add_file(
+        self,
+        member: ExportMember,
+        compress_type: int = ZIP_DEFLATED,
+        level: int = zlib.Z_DEFAULT_COMPRESSION,
+    ) -> bool:
+        """Stream one file into the archive; returns False if it vanished."""
+        try:
+            fp = open(member.path, "rb")
+        except FileNotFoundError:
+            return False
+
+        with fp:
+            arcname = member.arcname.encode("utf-8")
+            dos_time, dos_date = _dos_datetime(member.mtime)
+            # Same margin as zipfile: deflate may grow incompressible data
+            zip64 = member.size * 1.05 > ZIP64_LIMIT
+            offset = self._offset
+
+            extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+            self._emit(
+                _LOCAL_HEADER.pack(
+                    0x04034B50,
+                    45 if zip64 else 20,
+                    _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8,
+                    compress_type,
+                    dos_time,
+                    dos_date,
+                    0,
+                    0xFFFFFFFF if zip64 else 0,
+                    0xFFFFFFFF if zip64 else 0,
+                    len(arcname),
+                    len(extra),
+                )
+                + arcname
+                + extra
+            )
+
+            compressor = None
+            if compress_type == ZIP_DEFLATED:
+                compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+
+            crc = 0
+            size = 0
+            compressed_size = 0
+            while chunk := fp.read(READ_SIZE):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    compressed_size += len(chunk)
+                    self._emit(chunk)
+            if compressor is not None:
+                chunk = compressor.flush()
+                compressed_size += len(chunk)
+                self._emit(chunk)
+
+        if not zip64 and max(size, compressed_size) >= ZIP64_LIMIT:
+            raise RuntimeError(f"{member.arcname} grew past 4 GB while exporting")
+
+        descriptor = _DATA_DESCRIPTOR64 if zip64 else _DATA_DESCRIPTOR
+        self._emit(descriptor.pack(0x08074B50, crc, compressed_size, size))
+        self._entries.append(
+            _CentralEntry(
+                arcname,
+                compress_type,
+                dos_time,
+                dos_date,
+                crc,
+                compressed_size,
+                size,
+                offset,
+                zip64,
+            )
+        )
+        return True
+
+    def add_compressed(
+        self,
+        member: ExportMember,
+        compressed: _Compressed,
+        compress_type: int = ZIP_DEFLATED,
+    ) -> None:
+        """Add a member that was encoded up front; it needs no data descriptor."""
+        arcname = member.arcname.encode("utf-8")
+        dos_time, dos_date = _dos_datetime(member.mtime)
+        zip64 = max(compressed.size, len(compressed.data)) >= ZIP64_LIMIT
+        offset = self._offset
+
+        extra = b""
+        if zip64:
+            extra = struct.pack("<HHQQ", 1, 16, compressed.size, len(compressed.data))
+        self._emit(
+            _LOCAL_HEADER.pack(
+                0x04034B50,
+                45 if zip64 else 20,
+                _FLAG_UTF8,
+                compress_type,
+                dos_time,
+                dos_date,
+                compressed.crc,
+                0xFFFFFFFF if zip64 else len(compressed.data),
+                0xFFFFFFFF if zip64 else compressed.size,
+                len(arcname),
+                len(extra),
+            )
+            + arcname
+            + extra
+        )
+        self._emit(compressed.data)
+        self._entries.append(
+            _CentralEntry(
+                arcname,
+                compress_type,
+                dos_time,
+                dos_date,
+                compressed.crc,
+                len(compressed.data),
+                compressed.size,
+                offset,
+                zip64,
+                0,
+            )
+        )
+
+    def close(self) -> None:
+        """Write the central directory and end records."""
+        cd_offset = self._offset
+        for entry in self._entries:
+            zip64_fields = []
+            if entry.zip64 or entry.size >= ZIP64_LIMIT:
+                zip64_fields += [entry.size, entry.compressed_size]
+            if entry.offset >= ZIP64_LIMIT:
+                zip64_fields.append(entry.offset)
+            extra = b""
+            if zip64_fields:
+                extra = struct.pack(
+                    f"<HH{len(zip64_fields)}Q",
+                    1,
+                    8 * len(zip64_fields),
+                    *zip64_fields,
+                )
+            sizes_in_extra = len(zip64_fields) >= 2
+            version = 45 if zip64_fields else 20
+
+            self._emit(
+                _CENTRAL_HEADER.pack(
+                    0x02014B50,
+                    (3 << 8) | version,
+                    version,
+                    entry.flags | _FLAG_UTF8,
+                    entry.method,
+                    entry.dos_time,
+                    entry.dos_date,
+                    entry.crc,
+                    0xFFFFFFFF if sizes_in_extra else entry.compressed_size,
+                    0xFFFFFFFF if sizes_in_extra else entry.size,
+                    len(entry.arcname),
+                    len(extra),
+                    0,
+                    0,
+                    0,
+                    _UNIX_FILE_ATTR,
+                    0xFFFFFFFF if entry.offset >= ZIP64_LIMIT else entry.offset,
+                )
+                + entry.arcname
+                + extra
+            )
+
+        cd_size = self._offset - cd_offset
+        count = len(self._entries)
+        if count >= 0xFFFF or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+            end64_offset = self._offset
+            self._emit(
+                _END_RECORD64.pack(
+                    0x06064B50,
+                    _END_RECORD64.size - 12,
+                    (3 << 8) | 45,
+                    45,
+                    0,
+                    0,
+                    count,
+                    count,
+                    cd_size,
+                    cd_offset,
+                )
+            )
+            self._emit(_END_LOCATOR64.pack(0x07064B50, 0, end64_offset, 1))
+            count = min(count, 0xFFFF)
+            cd_size = min(cd_size, 0xFFFFFFFF)
+            cd_offset = min(cd_offset, 0xFFFFFFFF)
+
+        self._emit(
+            _END_RECORD.pack(0x06054B50, 0, 0, count, count, cd_size, cd_offset, 0)
+        )
+
+
+def _get_transcode_pool() -> ProcessPoolExecutor:
+    global _transcode_pool
+
+    if _transcode_pool is None:
+        _transcode_pool = ProcessPoolExecutor(
+            COMPRESS_WORKERS,
+            # Workers import only Pillow, not the backend and its event loop
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _transcode_pool
+
+
+def _transcoded_arcname(
+    member: ExportMember, transcode: TranscodeOptions, taken: set[str]
+) -> str | None:
     """
-    Create zip file in a separate thread to avoid blocking the event loop.
+    Archive name of the re-encoded image, or None to export it as is.
+    ``taken`` holds the names already in use and is updated.
     """
+    stem, ext = os.path.splitext(member.arcname)
+    if ext.lower() not in TRANSCODE_EXTENSIONS:
+        return None
+    arcname = stem + FORMAT_EXTENSIONS[transcode.format]
+    if arcname != member.arcname and arcname in taken:
+        # e.g. both image.png and image.webp exist
+        arcname = member.arcname + FORMAT_EXTENSIONS[transcode.format]
+    taken.add(arcname)
+    return arcname
+
+
+def _write_members(
+    writer: ZipStreamWriter,
+    members: list[ExportMember],
+    level: int,
+    transcode: TranscodeOptions | None = None,
+) -> None:
+    """
+    Add ``members`` to ``writer`` in order.
+
+    Small members that are worth deflating are compressed by a thread pool a
+    few files ahead of the writer (zlib releases the GIL), and with
+    ``transcode`` images are re-encoded by a process pool the same way.
+    Everything else is streamed from disk by the writer itself.
+    """
+    arcnames = {member.arcname for member in members}
+    with ThreadPoolExecutor(COMPRESS_WORKERS) as pool:
+        pending: deque[tuple[ExportMember, int, Future | None, str | None]] = deque()
+        lookahead = COMPRESS_WORKERS * 2
+
+        def write_next() -> None:
+            member, compress_type, future, transcoded_arcname = pending.popleft()
+            try:
+                result = future.result() if future is not None else None
+            except FileNotFoundError:
+                return
+            except Exception as e:
+                if not transcoded_arcname:
+                    raise
+                log.warning(f"Exporting {member.arcname} as is: {e}")
+                result = None
+
+            if result is None:
+                writer.add_file(member, compress_type, level)
+            elif transcoded_arcname:
+                writer.add_compressed(
+                    member._replace(arcname=transcoded_arcname),
+                    _Compressed(zlib.crc32(result), len(result), result),
+                    ZIP_STORED,
+                )
+            else:
+                writer.add_compressed(member, result)
+
+        try:
+            for member in members:
+                compress_type = _compress_type(member, level)
+                future = None
+                transcoded_arcname = None
+                if transcode is not None:
+                    transcoded_arcname = _transcoded_arcname(
+                        member, transcode, arcnames
+                    )
+                if transcoded_arcname:
+                    future = _get_transcode_pool().submit(
+                        transcode_image, member.path, transcode
+                    )
+                elif (
+                    compress_type == ZIP_DEFLATED
+                    and member.size <= PARALLEL_COMPRESS_MAX_SIZE
+                ):
+                    future = pool.submit(_deflate_file, member.path, level)
+                pending.append((member, compress_type, future, transcoded_arcname))
+                if len(pending) > lookahead:
+                    write_next()
+            while pending:
+                write_next()
+        finally:
+            for _, _, future, _ in pending:
+                if future is not None:
+                    future.cancel()
+
+
+class _ChunkedSink:
+    """Coalesces the writer's small writes into chunks of STREAM_CHUNK_SIZE."""
+
+    def __init__(self, put: Callable[[bytes], None]):
+        self._put = put
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        if len(self._buffer) >= STREAM_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+
+async def stream_zip(
+    members: list[ExportMember],
+    level: int = EXPORT_COMPRESS_LEVEL,
+    transcode: TranscodeOptions | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Build a ZIP of ``members`` in a worker thread and yield it chunk by chunk.
+
+    Already-compressed formats are stored as-is; other files are deflated at
+    ``level`` (0 stores everything). ``transcode`` re-encodes images.
+
+    Nothing is written to disk, and at most STREAM_QUEUE_SIZE chunks are held
+    in memory; the builder waits whenever the consumer falls behind.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[bytes | None] = asyncio.Queue(STREAM_QUEUE_SIZE)
+    cancelled = threading.Event()
+
+    def put(item: bytes | None) -> None:
+        if cancelled.is_set():
+            raise _ExportCancelled()
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
 
-    def _zip_files():
-        with zipfile.ZipFile(temp_zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-            # Walk through all files in the directory recursively
-            for root, dirs, files in os.walk(output_dir):
-                for file in files:
-                    file_path = Path(root) / file
-                    # Calculate relative path from output_dir
-                    arcname = file_path.relative_to(output_dir)
-                    zipf.write(file_path, arcname)
+    def build() -> None:
+        try:
+            sink = _ChunkedSink(put)
+            writer = ZipStreamWriter(sink.write)
+            _write_members(writer, members, level, transcode)
+            writer.close()
+            sink.flush()
+        finally:
+            if not cancelled.is_set():
+                put(None)
 
-    # Run the blocking zip operation in a thread pool
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, _zip_files)
+    builder = loop.run_in_executor(None, build)
+    try:
+        while (chunk := await queue.get()) is not None:
+            yield chunk
+        await builder
+    finally:
+        if not builder.done():
+            # The client went away: unblock the builder and let it stop
+            cancelled.set()
+            while not queue.empty():
+                queue.get_nowait()
+            try:
+                await builder
+            except _ExportCancelled:
+                pass
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import sys
+from typing import Any
+
+from log_manager import log
+
+PYTHON = sys.executable
+
+PROBE_TIMEOUT = 120
+
+# Runs in a short-lived interpreter so the backend never imports torch itself.
+PROBE_SCRIPT = """
+import json
+
+import torch
+
+info = {
+    "cuda": torch.cuda.is_available(),
+    "gpu_name": "",
+    "pytorch_version": torch.__version__,
+}
+if info["cuda"]:
+    info["gpu_name"] = torch.cuda.get_device_name(torch.cuda.current_device())
+print(json.dumps(info))
+"""
+
+
+class GpuProbe:
+    """Caches the result of probing torch/CUDA in a subprocess."""
+
+    def __init__(self):
+        self._result: dict[str, Any] | None = None
+        self._task: asyncio.Task[dict[str, Any]] | None = None
+
+    async def get(self) -> dict[str, Any]:
+        if self._result is not None:
+            return self._result
+
+        # Concurrent callers share the probe that is already running
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._probe())
+        task = self._task
+
+        result = await asyncio.shield(task)
+        if self._task is task:
+            self._result = result
+        return result
+
+    def refresh(self) -> None:
+        """Forget the cached result so the next request probes again."""
+        self._result = None
+        self._task = None
+
+    async def _probe(self) -> dict[str, Any]:
+        proc = await asyncio.create_subprocess_exec(
+            PYTHON,
+            "-c",
+            PROBE_SCRIPT,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), PROBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            log.warning("GPU probe timed out")
+            return {"cuda": False, "gpu_name": "", "pytorch_version": ""}
+
+        try:
+            return json.loads(stdout.decode("utf-8").strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            error = stderr.decode("utf-8", errors="replace").strip().splitlines()
+            log.warning(f"GPU probe failed: {error[-1] if error else proc.returncode}")
+            return {"cuda": False, "gpu_name": "", "pytorch_version": ""}
+
+
+gpuProbe = GpuProbe()
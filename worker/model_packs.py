@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import urllib.parse as urlparse
+from typing import NamedTuple
+
+import httpx
+from curl_cffi.requests import AsyncSession
+
+from config.load_config import UI_TYPE
+from log_manager import log
+from worker.download import (
+    CIVITAI_HOSTS,
+    _get_civitai_headers,
+    cached_source_metadata,
+    is_supported_model,
+    resolve_source_metadata,
+)
+
+# Concurrent HEAD requests while sizing the files of a pack
+SIZE_REQUESTS = 4
+# Seconds between the metadata lookups of the warm-up
+WARMUP_INTERVAL = 1.0
+# resource_lists are fetched again for downloads once this old
+MANIFEST_TTL = 60 * 60
+
+
+class CatalogResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def _iter_packs(packs):
+    """Packs are a list, or for ComfyUI a dict of category -> list."""
+    if isinstance(packs, dict):
+        for category in packs.values():
+            yield from category
+    else:
+        yield from packs
+
+
+async def _fetch_manifest(url: str) -> list[dict]:
+    async with httpx.AsyncClient() as client:
+        r = await client.get(url, follow_redirects=True, timeout=15)
+        r.raise_for_status()
+    return r.json()
+
+
+async def _fetch_size(url: str) -> int | None:
+    headers = {}
+    if (urlparse.urlparse(url).hostname or "") in CIVITAI_HOSTS:
+        headers = _get_civitai_headers()
+    try:
+        async with AsyncSession() as session:
+            response = await session.head(
+                url, headers=headers, allow_redirects=True, timeout=15
+            )
+            try:
+                if response.status_code >= 400:
+                    return None
+                length = response.headers.get("content-length")
+                return int(length) if length and length.isdigit() else None
+            finally:
+                await response.aclose()
+    except Exception:
+        return None
+
+
+class ModelPackCatalog:
+    """
+    The model packs offered for ``UI_TYPE``, parsed once and kept as a
+    ready-to-send body with an ETag. The file is only read again when its
+    mtime changes.
+
+    Each pack's resource_list is fetched in the background and the pack gains
+    ``file_count`` and ``total_size`` (null while any size is unknown).
+    """
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self._mtime_ns: int | None = None
+        self._packs = []
+        self._response: CatalogResponse | None = None
+        # resource_list url -> its models, and when they were fetched
+        self._manifests: dict[str, list[dict]] = {}
+        self._fetched_at: dict[str, float] = {}
+        # model url -> Content-Length
+        self._sizes: dict[str, int | None] = {}
+        self._expand_task: asyncio.Task | None = None
+
+    async def get(self) -> CatalogResponse:
+        if self.path is None:
+            if self._response is None:
+                self._render()
+            return self._response
+
+        mtime_ns = (await asyncio.to_thread(os.stat, self.path)).st_mtime_ns
+        if mtime_ns != self._mtime_ns:
+            packs = await asyncio.to_thread(self._read)
+            # Another request may have reloaded it meanwhile; either is current
+            self._packs, self._mtime_ns = packs, mtime_ns
+            self._render()
+            self._start_expand()
+        return self._response
+
+    def _read(self):
+        with open(self.path, encoding="utf-8") as fp:
+            return json.load(fp)
+
+    def _expand_pack(self, pack: dict) -> dict:
+        manifest = self._manifests.get(str(pack.get("url")))
+        if manifest is None:
+            return pack
+        models = [model for model in manifest if is_supported_model(model)]
+        sizes = [self._sizes.get(str(model["url"])) for model in models]
+        return {
+            **pack,
+            "file_count": len(models),
+            "total_size": None if None in sizes else sum(sizes),
+        }
+
+    def _render(self) -> None:
+        packs = self._packs
+        if isinstance(packs, dict):
+            packs = {
+                category: [self._expand_pack(pack) for pack in category_packs]
+                for category, category_packs in packs.items()
+            }
+        else:
+            packs = [self._expand_pack(pack) for pack in packs]
+        # Same encoding as JSONResponse
+        body = json.dumps(
+            packs, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self._response = CatalogResponse(body, etag)
+
+    def _start_expand(self) -> None:
+        if self._expand_task is None or self._expand_task.done():
+            self._expand_task = asyncio.create_task(self.expand())
+
+    async def load_manifest(self, url: str, max_age: float | None = None) -> list[dict]:
+        """
+        The resource_list at ``url``, fetched again when it is older than
+        ``max_age`` seconds (by default it is kept).
+        """
+        manifest = self._manifests.get(url)
+        if manifest is None or (
+            max_age is not None and time.monotonic() - self._fetched_at[url] > max_age
+        ):
+            manifest = await _fetch_manifest(url)
+            self._manifests[url] = manifest
+            self._fetched_at[url] = time.monotonic()
+        return manifest
+
+    async def expand(self) -> None:
+        """Fetch the resource_list and file sizes of every pack not yet known."""
+        semaphore = asyncio.Semaphore(SIZE_REQUESTS)
+
+        async def size(url: str) -> None:
+            async with semaphore:
+                self._sizes[url] = await _fetch_size(url)
+
+        for url in self._pack_urls():
+            try:
+                manifest = await self.load_manifest(url)
+            except Exception as exc:
+                log.warning(f"Could not fetch model pack {url}: {exc}")
+                continue
+
+            await asyncio.gather(
+                *(
+                    size(str(model["url"]))
+                    for model in manifest
+                    if is_supported_model(model)
+                    and str(model["url"]) not in self._sizes
+                )
+            )
+            self._render()
+
+    async def warm_up(self) -> None:
+        """
+        Resolve the checksum and file name of every model in every pack ahead
+        of time, so a pack download can queue its models without waiting on
+        CivitAI or Hugging Face.
+
+        Lookups run one at a time, ``WARMUP_INTERVAL`` seconds apart, to stay
+        out of the way of downloads the user starts and under the APIs' rate
+        limits.
+        """
+        try:
+            await self.get()
+        except (OSError, ValueError) as exc:
+            log.warning(f"Model pack warm-up skipped: {exc}")
+            return
+        if self._expand_task is not None:
+            await self._expand_task
+
+        urls = {
+            str(model["url"])
+            for pack_url in self._pack_urls()
+            for model in self._manifests.get(pack_url, [])
+            if is_supported_model(model)
+        }
+        resolved = 0
+        for url in sorted(urls):
+            if cached_source_metadata(url) is None:
+                await asyncio.sleep(WARMUP_INTERVAL)
+            if (await resolve_source_metadata(url)).expected_sha256:
+                resolved += 1
+        log.info(f"Model pack warm-up resolved {resolved} of {len(urls)} models")
+
+    def _pack_urls(self) -> list[str]:
+        return list(
+            dict.fromkeys(str(pack["url"]) for pack in _iter_packs(self._packs))
+        )
+
+
+def _catalog_path() -> str | None:
+    if UI_TYPE == "ZIMAGE":
+        return None
+    return f"./resources/{UI_TYPE.lower()}_model_packs.json"
+
+
+modelPacks = ModelPackCatalog(_catalog_path())
@@ -0,0 +1,304 @@
+import asyncio
+import os
+from typing import Any, Callable, Literal
+
+from config.load_config import OUTPUT_PATH
+from event_handler import manager
+from log_manager import log
+from utils.image_size import read_image_size
+from utils.inotify import (
+    IN_CLOSE_WRITE,
+    IN_CREATE,
+    IN_DELETE,
+    IN_DELETE_SELF,
+    IN_IGNORED,
+    IN_ISDIR,
+    IN_MOVE_SELF,
+    IN_MOVED_FROM,
+    IN_MOVED_TO,
+    IN_ONLYDIR,
+    IN_Q_OVERFLOW,
+    Inotify,
+    inotify_available,
+)
+from utils.ws_messages import OutputsData, OutputsMessage
+
+IMAGE_EXTENSIONS = frozenset(
+    {".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp", ".avif"}
+)
+# Without inotify the tree is rescanned this often; an unchanged file costs a stat
+POLL_INTERVAL = 5.0
+# How often to look for OUTPUT_PATH while it does not exist yet
+MISSING_DIR_INTERVAL = 5.0
+DIR_EVENTS = (
+    IN_CLOSE_WRITE
+    | IN_CREATE
+    | IN_DELETE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+SortKey = Literal["mtime", "name", "size"]
+
+
+def _is_image(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _make_entry(
+    rel_path: str, st: os.stat_result, full_path: str, known: dict | None
+) -> dict[str, Any]:
+    # Reuse the dimensions of a file that has not changed since it was indexed
+    if known and known["size"] == st.st_size and known["mtime"] == st.st_mtime:
+        return known
+    size = read_image_size(full_path)
+    return {
+        "path": rel_path,
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "width": size[0] if size else None,
+        "height": size[1] if size else None,
+    }
+
+
+class OutputIndex:
+    """
+    In-memory index of the images below OUTPUT_PATH.
+
+    Built once in a worker thread, then kept current from inotify events (or
+    a periodic rescan where inotify is unavailable). Clients are told about
+    additions and removals with an "outputs" WebSocket message.
+    """
+
+    def __init__(self, output_path: str):
+        self.root = os.path.abspath(output_path)
+        self.ready = False
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._sorted: dict[SortKey, list[dict[str, Any]]] = {}
+        self._listeners: list[Callable[[list[dict[str, Any]], list[str]], None]] = []
+
+    def _scan(
+        self,
+        rel_dir: str,
+        known: dict[str, dict[str, Any]],
+        add_watch: Callable[[str, str], None] | None = None,
+    ) -> dict[str, dict[str, Any]]:
+        """Index the tree below ``rel_dir``, watching each directory first."""
+        entries = {}
+        stack = [rel_dir]
+        while stack:
+            rel = stack.pop()
+            full = os.path.join(self.root, rel) if rel else self.root
+            try:
+                # Watched before it is listed, so nothing written in between
+                # is missed
+                if add_watch is not None:
+                    add_watch(full, rel)
+                with os.scandir(full) as it:
+                    for dir_entry in it:
+                        rel_path = f"{rel}/{dir_entry.name}" if rel else dir_entry.name
+                        if dir_entry.is_dir(follow_symlinks=False):
+                            stack.append(rel_path)
+                        elif _is_image(dir_entry.name) and dir_entry.is_file():
+                            entries[rel_path] = _make_entry(
+                                rel_path,
+                                dir_entry.stat(),
+                                dir_entry.path,
+                                known.get(rel_path),
+                            )
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+        return entries
+
+    def _stat_file(self, rel_path: str) -> dict[str, Any] | None:
+        full_path = os.path.join(self.root, rel_path)
+        try:
+            st = os.stat(full_path)
+        except FileNotFoundError:
+            return None
+        return _make_entry(rel_path, st, full_path, self._entries.get(rel_path))
+
+    def _apply(
+        self,
+        added: dict[str, dict[str, Any]],
+        removed: list[str],
+    ) -> tuple[list[dict[str, Any]], list[str]]:
+        """Update the index and return what actually changed."""
+        changed = []
+        for rel_path, entry in added.items():
+            if self._entries.get(rel_path) is not entry:
+                self._entries[rel_path] = entry
+                changed.append(entry)
+        gone = [p for p in removed if self._entries.pop(p, None) is not None]
+        if changed or gone:
+            self._sorted.clear()
+        return changed, gone
+
+    def add_listener(
+        self, listener: Callable[[list[dict[str, Any]], list[str]], None]
+    ) -> None:
+        """Call ``listener(added, removed)`` whenever the index changes."""
+        self._listeners.append(listener)
+
+    def remove_listener(
+        self, listener: Callable[[list[dict[str, Any]], list[str]], None]
+    ) -> None:
+        self._listeners.remove(listener)
+
+    async def _notify(self, added: list[dict[str, Any]], removed: list[str]) -> None:
+        if not added and not removed:
+            return
+        for listener in self._listeners:
+            listener(added, removed)
+        message = OutputsMessage(data=OutputsData(added=added, removed=removed))
+        await manager.broadcast(message.model_dump_json())
+
+    def query(
+        self,
+        offset: int = 0,
+        limit: int = 100,
+        sort: SortKey = "mtime",
+        order: Literal["asc", "desc"] = "desc",
+    ) -> dict[str, Any]:
+        ordered = self._sorted.get(sort)
+        if ordered is None:
+            if sort == "name":
+                key = lambda e: e["path"]  # noqa: E731
+            else:
+                key = lambda e: (e[sort], e["path"])  # noqa: E731
+            ordered = self._sorted[sort] = sorted(self._entries.values(), key=key)
+
+        total = len(ordered)
+        if order == "desc":
+            start = max(total - offset - limit, 0)
+            items = ordered[start : max(total - offset, 0)][::-1]
+        else:
+            items = ordered[offset : offset + limit]
+        return {"ready": self.ready, "total": total, "items": items}
+
+    def get(self, rel_path: str) -> dict[str, Any] | None:
+        return self._entries.get(rel_path)
+
+    async def _rebuild(self, add_watch: Callable[[str, str], None] | None = None):
+        entries = await asyncio.to_thread(
+            self._scan, "", dict(self._entries), add_watch
+        )
+        removed = [p for p in self._entries if p not in entries]
+        added, removed = self._apply(entries, removed)
+        if self.ready:
+            await self._notify(added, removed)
+        self.ready = True
+
+    async def _wait_for_root(self) -> None:
+        while not await asyncio.to_thread(os.path.isdir, self.root):
+            await asyncio.sleep(MISSING_DIR_INTERVAL)
+
+    def _handle_events(
+        self, events, dirs: dict[int, str], inotify: Inotify
+    ) -> tuple[dict[str, dict[str, Any]], list[str], bool]:
+        """
+        Translate a batch of inotify events into index changes. Runs in a
+        worker thread; returns (added, removed, root_gone).
+        """
+        added: dict[str, dict[str, Any]] = {}
+        removed: list[str] = []
+
+        def add_watch(full: str, rel: str) -> None:
+            dirs[inotify.add_watch(full, DIR_EVENTS)] = rel
+
+        for event in events:
+            if event.mask & IN_IGNORED:
+                dirs.pop(event.wd, None)
+                continue
+            rel_dir = dirs.get(event.wd)
+            if rel_dir is None:
+                continue
+            if event.mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if rel_dir == "":
+                    return added, removed, True
+                continue
+
+            rel_path = f"{rel_dir}/{event.name}" if rel_dir else event.name
+            if event.mask & IN_ISDIR:
+                prefix = rel_path + "/"
+                if event.mask & (IN_CREATE | IN_MOVED_TO):
+                    added.update(self._scan(rel_path, self._entries, add_watch))
+                else:
+                    removed += [p for p in self._entries if p.startswith(prefix)]
+                    for p in [p for p in added if p.startswith(prefix)]:
+                        del added[p]
+            elif _is_image(event.name):
+                if event.mask & (IN_DELETE | IN_MOVED_FROM):
+                    added.pop(rel_path, None)
+                    removed.append(rel_path)
+                elif event.mask & IN_CREATE:
+                    # Still being written; IN_CLOSE_WRITE follows
+                    continue
+                elif (entry := self._stat_file(rel_path)) is not None:
+                    added[rel_path] = entry
+                    if rel_path in removed:
+                        removed.remove(rel_path)
+        return added, removed, False
+
+    async def _monitor_inotify(self, inotify: Inotify) -> None:
+        while True:
+            await self._wait_for_root()
+            dirs: dict[int, str] = {}
+
+            def add_watch(full: str, rel: str) -> None:
+                dirs[inotify.add_watch(full, DIR_EVENTS)] = rel
+
+            await self._rebuild(add_watch)
+
+            while True:
+                events = await inotify.read_events()
+                if any(event.mask & IN_Q_OVERFLOW for event in events):
+                    # Events were lost: watch everything again and rescan
+                    log.warning("inotify queue overflowed, rescanning outputs")
+                    break
+
+                added, removed, root_gone = await asyncio.to_thread(
+                    self._handle_events, events, dirs, inotify
+                )
+                added, removed = self._apply(added, removed)
+                await self._notify(added, removed)
+                if root_gone:
+                    added, removed = self._apply({}, list(self._entries))
+                    await self._notify(added, removed)
+                    break
+
+            for wd in list(dirs):
+                inotify.rm_watch(wd)
+
+    async def _monitor_polling(self) -> None:
+        while True:
+            await self._wait_for_root()
+            await self._rebuild()
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def monitor(self) -> None:
+        inotify = None
+        if inotify_available():
+            try:
+                inotify = Inotify()
+            except OSError as e:
+                log.warning(f"inotify unavailable, polling {self.root}: {e}")
+
+        try:
+            if inotify is not None:
+                await self._monitor_inotify(inotify)
+            else:
+                await self._monitor_polling()
+
+        except Exception as e:
+            log.error(f"Error indexing {self.root}: {e}")
+
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+
+outputIndex = OutputIndex(OUTPUT_PATH)
@@ -1,12 +1,154 @@
 import asyncio
+import io
 import os
+import re
+import time
+from bisect import bisect_left, bisect_right
 from datetime import datetime
+from heapq import merge
+from itertools import islice
 
-from config.load_config import PROGRAM_LOG, UI_TYPE
+from config.load_config import LOG_BUFFER_LINES, LOG_TAIL_BYTES, PROGRAM_LOG, UI_TYPE
 from event_handler import manager
-from utils.ws_messages import LogData, LogMessage
+from log_manager import log
+from utils.inotify import (
+    IN_CREATE,
+    IN_DELETE_SELF,
+    IN_MODIFY,
+    IN_MOVE_SELF,
+    IN_MOVED_TO,
+    Inotify,
+    inotify_available,
+)
+from utils.metrics import registry
+from utils.ws_messages import LogData, LogMessage, LogReplaceMessage
 from worker.create_log_file import touch_files
 
+# Interval of the stat loop used when inotify is unavailable.
+POLL_INTERVAL = 0.1
+# With inotify, still re-check the file this often in case an event is missed
+# (for example on network file systems that do not deliver them).
+INOTIFY_SAFETY_INTERVAL = 5.0
+READ_CHUNK_SIZE = 1024 * 1024
+HISTORY_BLOCK_SIZE = 64 * 1024
+# Minimum seconds between two updates sent for the same progress line
+PROGRESS_UPDATE_INTERVAL = 0.25
+
+LOG_FILE_EVENTS = IN_MODIFY | IN_MOVE_SELF | IN_DELETE_SELF
+
+# Bytes of on-disk history a single search request scans before it returns a
+# cursor to continue from.
+SEARCH_SCAN_BYTES = 64 * 1024 * 1024
+MAX_MATCHES_PER_LINE = 20
+
+LOG_LEVELS = ("error", "warning", "info", "debug")
+_LEVEL_PATTERN = re.compile(r"\b(CRITICAL|FATAL|ERROR|WARN(?:ING)?|INFO|DEBUG)\b")
+_LEVEL_NAMES = {
+    "CRIT": "error",
+    "FATA": "error",
+    "ERRO": "error",
+    "WARN": "warning",
+    "INFO": "info",
+    "DEBU": "debug",
+}
+# Untagged lines that still indicate a failure (tracebacks, OOM, exceptions)
+_ERROR_PATTERN = re.compile(
+    r"Traceback \(most recent call last\)|\w+(?:Error|Exception)\b|out of memory",
+    re.IGNORECASE,
+)
+
+
+def _entry_seq(entry: dict) -> int:
+    return entry["seq"]
+
+
+def _find_tail_start(fd: int, size: int, max_lines: int, max_bytes: int) -> int:
+    """
+    Scan backwards from the end of the file and return the offset of the oldest
+    line to load, so that at most ``max_lines`` lines and about ``max_bytes``
+    bytes are read at startup.
+    """
+    floor = max(0, size - max_bytes)
+    pos = size
+    newlines = 0
+    while pos > floor:
+        read_size = min(HISTORY_BLOCK_SIZE, pos - floor)
+        pos -= read_size
+        block = os.pread(fd, read_size, pos)
+
+        idx = len(block)
+        if pos + read_size == size and block.endswith(b"\n"):
+            # The newline terminating the last line does not start a new one
+            idx -= 1
+        while (idx := block.rfind(b"\n", 0, idx)) != -1:
+            newlines += 1
+            if newlines >= max_lines:
+                return pos + idx + 1
+
+    if floor == 0:
+        return 0
+
+    # Byte budget reached: start at the first complete line inside the window
+    block = os.pread(fd, min(HISTORY_BLOCK_SIZE, size - floor + 1), floor - 1)
+    idx = block.find(b"\n")
+    return floor if idx == -1 else floor + idx
+
+
+def _iter_lines_backward(fd: int, end: int, floor: int):
+    """
+    Yield non-empty ``(offset, line)`` pairs between the line boundaries
+    ``floor`` and ``end``, newest first.
+    """
+    pending = b""
+    pos = end
+    while pos > floor:
+        read_size = min(HISTORY_BLOCK_SIZE, pos - floor)
+        pos -= read_size
+        pending = os.pread(fd, read_size, pos) + pending
+
+        # The first line in the block may have started before it
+        cut = 0 if pos == floor else pending.find(b"\n") + 1
+        if cut == 0 and pos != floor:
+            continue
+
+        batch = []
+        offset = pos + cut
+        for raw in io.BytesIO(pending[cut:]):
+            if raw.strip():
+                batch.append((offset, raw))
+            offset += len(raw)
+        yield from reversed(batch)
+        pending = pending[:cut]
+
+
+def _read_lines_before(
+    fd: int, end: int, floor: int, count: int
+) -> list[tuple[int, bytes]]:
+    """Return the last ``count`` lines between ``floor`` and ``end``, oldest first."""
+    found = list(islice(_iter_lines_backward(fd, end, floor), count))
+    found.reverse()
+    return found
+
+
+def _last_segment(raw: bytes) -> bytes:
+    """Return what a terminal would show for a line overwritten with \r."""
+    for segment in reversed(raw.split(b"\r")):
+        if segment.strip():
+            return segment
+    return b""
+
+
+def _classify_level(line: str) -> str | None:
+    match = _LEVEL_PATTERN.search(line)
+    if match:
+        return _LEVEL_NAMES[match.group(1)[:4]]
+    if _ERROR_PATTERN.search(line):
+        return "error"
+    return None
+
+
+LOG_LINES = registry.counter("sdui_log_lines_total", "Lines read from PROGRAM_LOG")
+
 
 class ProgramLog:
     log_path = ""
@@ -21,85 +163,423 @@ class ProgramLog:
         self.log_path = PROGRAM_LOG
         self.key = KEY
 
-        self._log_lst.clear()
-        with open(self.log_path, "r", encoding="utf-8", errors="replace") as fp:
-            f = fp.readlines()
-            for data in f:
-                entry = {"t": datetime.now().isoformat(), "m": data.strip()}
-                self._log_lst.append(entry)
+        # Sequence ids are byte offsets of each line in the log file. They stay
+        # stable across reloads and keep increasing after the file is rotated.
+        self._seq_base = 0
 
-    def get(self):
-        return self._log_lst
+        # Bytes of the current file consumed so far, and a trailing line that
+        # has not been terminated by a newline yet. Once the trailing line
+        # contains a carriage return only its bytes from the last \r are kept, so
+        # _line_start remembers where that line began.
+        self._pos = 0
+        self._partial = b""
+        self._line_start = 0
+
+        # Buffered entry showing the latest state of a \r-overwritten line
+        # (progress bar) that is still being written, and the text and time of
+        # the last update sent for it.
+        self._progress: dict | None = None
+        self._progress_sent = ""
+        self._progress_sent_at = 0.0
+
+        # Only the tail of the file is loaded; older lines stay on disk and are
+        # read back on demand by get().
+        self._log_lst = []
+        # Sequence ids of buffered lines per detected level, for search
+        self._level_index: dict[str, list[int]] = {level: [] for level in LOG_LEVELS}
+        self._fp = open(self.log_path, "rb")
+        st = os.fstat(self._fp.fileno())
+        self._inode = st.st_ino
+        self._pos = _find_tail_start(
+            self._fp.fileno(), st.st_size, LOG_BUFFER_LINES, LOG_TAIL_BYTES
+        )
+        self._line_start = self._pos
+        self._fp.seek(self._pos)
+        self._read_available()
+
+    def _append(self, offset: int, raw: bytes) -> dict | None:
+        line = raw.decode("utf-8", errors="replace").strip()
+        if not line:
+            return None
+
+        entry = {
+            "seq": self._seq_base + offset,
+            "t": datetime.now().isoformat(),
+            "m": line,
+        }
+        self._log_lst.append(entry)
+        LOG_LINES.inc()
+
+        level = _classify_level(line)
+        if level is not None:
+            self._level_index[level].append(entry["seq"])
+
+        # Trim in batches so the buffer is not shifted on every new line
+        if len(self._log_lst) > LOG_BUFFER_LINES + LOG_BUFFER_LINES // 4:
+            del self._log_lst[: len(self._log_lst) - LOG_BUFFER_LINES]
+            oldest = self._log_lst[0]["seq"]
+            for seqs in self._level_index.values():
+                del seqs[: bisect_left(seqs, oldest)]
+        return entry
+
+    def _finish_line(self, offset: int, raw: bytes) -> list[tuple[dict, bool]]:
+        text = _last_segment(raw)
+        progress, self._progress = self._progress, None
+
+        if progress is not None:
+            # A trailing "\r\n" leaves the last shown state in place
+            progress["m"] = (
+                text.decode("utf-8", errors="replace").strip() or progress["m"]
+            )
+            if progress["m"] == self._progress_sent:
+                return []
+            return [(progress, True)]
+
+        entry = self._append(offset, text)
+        return [] if entry is None else [(entry, False)]
+
+    def _update_progress(self, offset: int, raw: bytes) -> list[tuple[dict, bool]]:
+        """Show the latest completed state of a line that is overwritten with \r."""
+        line = _last_segment(raw).decode("utf-8", errors="replace").strip()
+        if not line:
+            return []
+
+        now = time.monotonic()
+        if self._progress is None:
+            self._progress = self._append(offset, line.encode())
+            self._progress_sent = line
+            self._progress_sent_at = now
+            return [(self._progress, False)]
+
+        self._progress["m"] = line
+        if line == self._progress_sent or (
+            now - self._progress_sent_at < PROGRESS_UPDATE_INTERVAL
+        ):
+            return []
+        self._progress_sent = line
+        self._progress_sent_at = now
+        return [(self._progress, True)]
+
+    def _ingest(self, data: bytes) -> list[tuple[dict, bool]]:
+        """
+        Buffer newly read bytes and turn every completed line into an entry.
+
+        Returns ``(entry, replaced)`` pairs; ``replaced`` marks a new state of a
+        progress line that was already sent rather than a new line.
+        """
+        buffer = self._partial + data
+        data_offset = self._pos - len(self._partial)
+        self._pos += len(data)
+
+        updates = []
+        line_start = self._line_start
+        start = 0
+        while (end := buffer.find(b"\n", start)) != -1:
+            updates.extend(self._finish_line(line_start, buffer[start : end + 1]))
+            start = end + 1
+            line_start = data_offset + start
+
+        partial = buffer[start:]
+        cr = partial.rfind(b"\r")
+        if cr != -1:
+            updates.extend(self._update_progress(line_start, partial[:cr]))
+            # Earlier states of the line are superseded and need not be kept
+            partial = partial[cr:]
+
+        self._partial = partial
+        self._line_start = line_start
+        return updates
+
+    def _rotate(self) -> list[tuple[dict, bool]]:
+        """Finish the current file and continue sequence ids after it."""
+        updates = []
+        if self._partial or self._progress is not None:
+            updates = self._finish_line(self._line_start, self._partial)
+
+        self._seq_base += self._pos
+        self._pos = 0
+        self._partial = b""
+        self._line_start = 0
+        return updates
+
+    def _read_available(self) -> list[tuple[dict, bool]]:
+        updates = []
+        while chunk := self._fp.read(READ_CHUNK_SIZE):
+            updates.extend(self._ingest(chunk))
+        return updates
+
+    def _read_changes(self) -> tuple[list[tuple[dict, bool]], bool]:
+        """
+        Read everything appended since the last call and follow rotations.
+
+        The file counts as rotated when its path now points at another inode
+        (rename and recreate), or when it shrank below what was already read
+        (copy and truncate). Returns the updates and whether it was reopened.
+        """
+        updates = self._read_available()
 
-    async def monitor_log(self):
-        # Get initial file size
-        log_file_path = self.log_path
-        file_size = os.path.getsize(log_file_path)
         try:
-            stop_var = False
-            with open(log_file_path, "r", encoding="utf-8", errors="replace") as f:
-                # Move to the end of the file
-                f.seek(file_size)
-
-                # Continue monitoring for changes
-                while True:
-                    try:
-                        # Check if file size has changed
-                        current_size = os.path.getsize(log_file_path)
-
-                        if current_size > file_size:
-                            # Read only the new data
-                            f.seek(file_size)
-                            new_data = f.read()
-                            # print(new_data, end="", flush=True)
-
-                            # Split by newlines and broadcast each line separately
-                            lines = new_data.split("\n")
-                            for line in lines:
-                                if line:  # Skip empty lines
-                                    s = LogMessage(key=self.key, data=LogData(m=line))
-
-                                    entry = {
-                                        "t": datetime.now().isoformat(),
-                                        "m": line,
-                                    }
-                                    self._log_lst.append(entry)
-
-                                    await manager.broadcast(s.model_dump_json())
-
-                            file_size = current_size
-
-                        # If file has been truncated (rotated), start from beginning
-                        elif current_size < file_size:
-                            f.seek(0)
-                            new_data = f.read()
-
-                            # Split by newlines and broadcast each line separately
-                            lines = new_data.split("\n")
-                            for line in lines:
-                                if line:  # Skip empty lines
-                                    s = LogMessage(key=self.key, data=LogData(m=line))
-
-                                    entry = {
-                                        "t": datetime.now().isoformat(),
-                                        "m": line,
-                                    }
-                                    self._log_lst.append(entry)
-
-                                    await manager.broadcast(s.model_dump_json())
-                            file_size = current_size
-
-                        # time.sleep(0.1)
-                        await asyncio.sleep(0.1)
-                    except KeyboardInterrupt as e:
-                        stop_var = True
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return updates, False
+
+        if st.st_ino != self._inode:
+            updates.extend(self._rotate())
+            self._fp.close()
+            self._fp = open(self.log_path, "rb")
+            self._inode = os.fstat(self._fp.fileno()).st_ino
+            updates.extend(self._read_available())
+            return updates, True
+
+        if st.st_size < self._pos:
+            updates.extend(self._rotate())
+            self._fp.seek(0)
+            updates.extend(self._read_available())
+
+        return updates, False
+
+    def get(
+        self,
+        tail: int | None = None,
+        since: int | None = None,
+        before: int | None = None,
+        limit: int | None = None,
+    ):
+        """
+        Return buffered log lines, optionally narrowed by sequence id.
+
+        ``since`` and ``before`` are exclusive cursors. ``tail`` returns the last
+        N lines of the selection; ``limit`` pages forward from ``since`` and
+        backward from ``before``. Lines older than the in-memory buffer are read
+        back from the log file when a backward page reaches past it.
+        """
+        if tail is None and since is None and before is None and limit is None:
+            return self._log_lst
+
+        lines = self._log_lst
+        start = 0 if since is None else bisect_right(lines, since, key=_entry_seq)
+        end = (
+            len(lines) if before is None else bisect_left(lines, before, key=_entry_seq)
+        )
+
+        count = tail if tail is not None else limit
+        if count is None:
+            return lines[start:end]
+        if count <= 0:
+            return []
+        if tail is None and since is not None and before is None:
+            return lines[start : min(start + count, end)]
+
+        selected = lines[max(start, end - count) : end]
+        if len(selected) < count and start == 0:
+            history_end = selected[0]["seq"] if selected else before
+            if history_end is None:
+                history_end = self._seq_base + self._pos
+            selected = (
+                self._read_history(history_end, since, count - len(selected)) + selected
+            )
+        return selected
+
+    def _read_history(self, end_seq: int, since: int | None, count: int) -> list:
+        """Read lines of the current log file that precede the buffer."""
+        base = self._seq_base
+        # ``since`` is a line start; read from it and drop that line afterwards
+        floor = 0 if since is None else max(0, since - base)
+        if end_seq - base <= floor:
+            return []
+
+        try:
+            found = _read_lines_before(
+                self._fp.fileno(), end_seq - base, floor, count + 1
+            )
+        except (OSError, ValueError):
+            # The file was closed by a concurrent rotation
+            return []
+
+        if since is not None:
+            found = [(offset, raw) for offset, raw in found if base + offset > since]
+        found = found[-count:]
+
+        return [
+            {
+                "seq": base + offset,
+                "t": None,
+                "m": _last_segment(raw).decode("utf-8", errors="replace").strip(),
+            }
+            for offset, raw in found
+        ]
+
+    def search(
+        self,
+        query: str | None = None,
+        regex: bool = False,
+        ignore_case: bool = True,
+        levels: list[str] | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        before: int | None = None,
+        limit: int = 100,
+    ) -> dict:
+        """
+        Search the buffer and the on-disk history before it, newest first.
+
+        Returns at most ``limit`` matches, each with the character spans that
+        matched ``query``, and a ``next_cursor`` to pass as ``before`` for the
+        next page (``None`` once everything was searched). Lines read back from
+        disk have no ingest time, so a time range only searches the buffer.
+        Blocking; run it in a worker thread.
+        """
+        flags = re.IGNORECASE if ignore_case else 0
+        pattern = None
+        if query:
+            pattern = re.compile(query if regex else re.escape(query), flags)
+        wanted_levels = set(levels) if levels else None
+
+        results = []
+
+        def check(seq: int, t: str | None, line: str, level: str | None) -> bool:
+            if wanted_levels is not None and level not in wanted_levels:
+                return False
+            spans = []
+            if pattern is not None:
+                for match in pattern.finditer(line):
+                    spans.append([match.start(), match.end()])
+                    if len(spans) >= MAX_MATCHES_PER_LINE:
                         break
+                if not spans:
+                    return False
+            results.append(
+                {"seq": seq, "t": t, "m": line, "level": level, "matches": spans}
+            )
+            return len(results) >= limit
 
-            print("\nLog monitoring stopped.")
+        # Snapshot so lines appended by the tailer do not shift the indexes
+        lines = list(self._log_lst)
+        stop = (
+            len(lines) if before is None else bisect_left(lines, before, key=_entry_seq)
+        )
+
+        if wanted_levels is not None:
+            # Only visit the lines tagged with one of the requested levels
+            candidates = merge(*(list(self._level_index[lvl]) for lvl in wanted_levels))
+            oldest = lines[0]["seq"] if lines else 0
+            limit_seq = lines[stop - 1]["seq"] if stop else -1
+            seqs = [seq for seq in candidates if oldest <= seq <= limit_seq]
+            positions = (
+                bisect_left(lines, seq, key=_entry_seq) for seq in reversed(seqs)
+            )
+        else:
+            positions = range(stop - 1, -1, -1)
+
+        for idx in positions:
+            entry = lines[idx]
+            entry_time = datetime.fromisoformat(entry["t"])
+            if start is not None and entry_time < start:
+                # Older lines cannot match either
+                return {"results": results, "next_cursor": None}
+            if end is not None and entry_time > end:
+                continue
+            level = _classify_level(entry["m"])
+            if check(entry["seq"], entry["t"], entry["m"], level):
+                return {"results": results, "next_cursor": entry["seq"]}
+
+        if start is not None or end is not None:
+            return {"results": results, "next_cursor": None}
+
+        # Continue into the part of the current log file that is not buffered
+        base = self._seq_base
+        history_end = lines[0]["seq"] if lines else base + self._pos
+        if before is not None:
+            history_end = min(history_end, before)
+        if history_end <= base:
+            return {"results": results, "next_cursor": None}
+
+        try:
+            lines_checked = 0
+            for offset, raw in _iter_lines_backward(
+                self._fp.fileno(), history_end - base, 0
+            ):
+                seq = base + offset
+                if lines_checked and history_end - seq > SEARCH_SCAN_BYTES:
+                    # Scan budget used up; resume before the last checked line
+                    return {"results": results, "next_cursor": seq + len(raw)}
+                lines_checked += 1
+                line = _last_segment(raw).decode("utf-8", errors="replace").strip()
+                if check(seq, None, line, _classify_level(line)):
+                    return {"results": results, "next_cursor": seq}
+        except (OSError, ValueError):
+            # The file was closed by a concurrent rotation
+            pass
+
+        return {"results": results, "next_cursor": None}
+
+    async def _broadcast_updates(self, updates: list[tuple[dict, bool]]):
+        for entry, replaced in updates:
+            data = LogData(m=entry["m"], seq=entry["seq"])
+            if replaced:
+                s = LogReplaceMessage(key=self.key, data=data)
+            else:
+                s = LogMessage(key=self.key, data=data)
+            await manager.broadcast(s.model_dump_json())
+
+    async def _monitor_inotify(self, inotify: Inotify):
+        directory = os.path.dirname(os.path.abspath(self.log_path))
+        filename = os.path.basename(self.log_path)
+
+        # The directory watch catches a new log file created in place of the old one
+        dir_wd = inotify.add_watch(directory, IN_CREATE | IN_MOVED_TO)
+        file_wd = inotify.add_watch(self.log_path, LOG_FILE_EVENTS)
+
+        while True:
+            try:
+                events = await asyncio.wait_for(
+                    inotify.read_events(), INOTIFY_SAFETY_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                events = []
+
+            if events and all(e.wd == dir_wd and e.name != filename for e in events):
+                continue
+
+            updates, reopened = self._read_changes()
+            if reopened:
+                inotify.rm_watch(file_wd)
+                file_wd = inotify.add_watch(self.log_path, LOG_FILE_EVENTS)
+            await self._broadcast_updates(updates)
+
+    async def _monitor_polling(self):
+        while True:
+            updates, _ = self._read_changes()
+            await self._broadcast_updates(updates)
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def monitor_log(self):
+        inotify = None
+        if inotify_available():
+            try:
+                inotify = Inotify()
+            except OSError as e:
+                log.warning(f"inotify unavailable, polling {self.log_path}: {e}")
+
+        try:
+            if inotify is not None:
+                await self._monitor_inotify(inotify)
+            else:
+                await self._monitor_polling()
 
         except Exception as e:
             print(f"\nError monitoring log file: {e}")
             return
 
+        finally:
+            if inotify is not None:
+                inotify.close()
+
 
 programLog = ProgramLog(PROGRAM_LOG, UI_TYPE)
+
+registry.gauge(
+    "sdui_log_buffer_lines",
+    "Lines of PROGRAM_LOG held in memory",
+    fn=lambda: len(programLog._log_lst),
+)
@@ -1,48 +1,166 @@
 import asyncio
+import time
+import uuid
+from collections import deque
 
 from config.load_config import UI_TYPE
+from event_handler import manager
 from log_manager import log
+from utils.metrics import LONG_BUCKETS, registry
+from utils.ws_messages import RestartData, RestartMessage
+from worker.check_process import programStatus
+from worker.gpu_probe import gpuProbe
 
 path_mapping = {"COMFY": "/notebooks", "FORGE": "/notebooks", "INVOKEAI": "/invokeai"}
 
+# Seconds each phase may take before the restart is given up
+STOP_TIMEOUT = 60.0
+START_TIMEOUT = 120.0
+READY_TIMEOUT = 600.0
+# Script output kept on each job for /api/restart/{id}
+OUTPUT_LINES = 500
+MAX_JOBS = 20
 
-async def restart_program():
-    cmd_stop = ["/bin/bash", f"{path_mapping[UI_TYPE]}/stop_process.sh"]
-
-    proc_stop = await asyncio.create_subprocess_exec(
-        *cmd_stop,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT,
-    )
-
-    try:
-        # read lines as they come in
-        assert proc_stop.stdout is not None
-        async for raw_line in proc_stop.stdout:
-            line = raw_line.decode("utf-8").strip("\n")
-            log.debug(line)
-
-    except asyncio.CancelledError:
-        # if someone cancels the task, kill the subprocess
-        proc_stop.kill()
-        await proc_stop.wait()
-
-    cmd_start = ["/bin/bash", f"{path_mapping[UI_TYPE]}/start_process.sh"]
-
-    proc_start = await asyncio.create_subprocess_exec(
-        *cmd_start,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT,
-    )
-
-    try:
-        # read lines as they come in
-        assert proc_start.stdout is not None
-        async for raw_line in proc_start.stdout:
-            line = raw_line.decode("utf-8").strip("\n")
-            log.debug(line)
-
-    except asyncio.CancelledError:
-        # if someone cancels the task, kill the subprocess
-        proc_start.kill()
-        await proc_start.wait()
+RESTART_PHASE_SECONDS = registry.histogram(
+    "sdui_restart_phase_seconds",
+    "Duration of the stop, start and ready phases of UI restarts",
+    ("phase",),
+    buckets=LONG_BUCKETS,
+)
+RESTARTS = registry.counter("sdui_restarts_total", "UI restarts by result", ("result",))
+
+
+class RestartJob:
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.phase = "stopping"
+        self.started_at = time.time()
+        # stop, start and ready, in seconds
+        self.durations: dict[str, float] = {}
+        self.error: str | None = None
+        self.output: deque[str] = deque(maxlen=OUTPUT_LINES)
+        self.task: asyncio.Task | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.phase in ("ready", "failed")
+
+    def message(self, line: str | None = None) -> RestartMessage:
+        return RestartMessage(
+            data=RestartData(
+                id=self.id,
+                phase=self.phase,
+                line=line,
+                durations=self.durations,
+                error=self.error,
+            )
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "phase": self.phase,
+            "started_at": self.started_at,
+            "durations": self.durations,
+            "error": self.error,
+            "output": list(self.output),
+        }
+
+
+class RestartJobs:
+    """
+    Runs stop_process.sh and start_process.sh as a background job and waits
+    until ProgramStatus sees the UI again. Progress and script output go to
+    WebSocket clients as "restart" messages.
+    """
+
+    def __init__(self):
+        self._jobs: dict[str, RestartJob] = {}
+
+    def get(self, job_id: str) -> RestartJob | None:
+        return self._jobs.get(job_id)
+
+    def start(self) -> RestartJob:
+        """Start a restart, or return the one already running."""
+        for job in self._jobs.values():
+            if not job.done:
+                return job
+
+        job = RestartJob(uuid.uuid4().hex[:12])
+        self._jobs[job.id] = job
+        while len(self._jobs) > MAX_JOBS:
+            del self._jobs[next(iter(self._jobs))]
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    async def _set_phase(self, job: RestartJob, phase: str) -> None:
+        job.phase = phase
+        await manager.broadcast(job.message().model_dump_json())
+
+    async def _run_script(self, job: RestartJob, script: str, timeout: float) -> None:
+        proc = await asyncio.create_subprocess_exec(
+            "/bin/bash",
+            f"{path_mapping[UI_TYPE]}/{script}",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        try:
+            async with asyncio.timeout(timeout):
+                # read lines as they come in
+                assert proc.stdout is not None
+                async for raw_line in proc.stdout:
+                    line = raw_line.decode("utf-8", errors="replace").rstrip("\n")
+                    log.debug(line)
+                    job.output.append(line)
+                    await manager.broadcast(job.message(line).model_dump_json())
+                await proc.wait()
+        except TimeoutError:
+            raise TimeoutError(f"{script} did not finish within {timeout:g}s")
+        finally:
+            # timed out or cancelled: don't leave the script behind
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+        if proc.returncode:
+            log.warning(f"{script} exited with code {proc.returncode}")
+
+    async def _run(self, job: RestartJob) -> None:
+        programStatus.expect_restart()
+        await self._set_phase(job, "stopping")
+        try:
+            phase_start = time.monotonic()
+            await self._run_script(job, "stop_process.sh", STOP_TIMEOUT)
+            job.durations["stop"] = time.monotonic() - phase_start
+
+            await self._set_phase(job, "starting")
+            phase_start = time.monotonic()
+            await self._run_script(job, "start_process.sh", START_TIMEOUT)
+            job.durations["start"] = time.monotonic() - phase_start
+
+            await self._set_phase(job, "waiting")
+            phase_start = time.monotonic()
+            try:
+                await programStatus.wait_until_running(READY_TIMEOUT)
+            except TimeoutError:
+                raise TimeoutError(f"UI was not ready within {READY_TIMEOUT:g}s")
+            job.durations["ready"] = time.monotonic() - phase_start
+        except Exception as exc:
+            job.error = str(exc) or type(exc).__name__
+            log.error(f"Restart {job.id} failed: {job.error}")
+            RESTARTS.inc(result="failed")
+            await self._set_phase(job, "failed")
+            return
+
+        for phase, seconds in job.durations.items():
+            RESTART_PHASE_SECONDS.observe(seconds, phase=phase)
+        RESTARTS.inc(result="ready")
+        gpuProbe.refresh()
+        log.info(
+            f"Restart {job.id} done: "
+            + ", ".join(f"{k} {v:.1f}s" for k, v in job.durations.items())
+        )
+        await self._set_phase(job, "ready")
+
+
+restartJobs = RestartJobs()
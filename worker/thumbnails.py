@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from config.load_config import (
+    CACHE_PATH,
+    OUTPUT_PATH,
+    THUMBNAIL_CACHE_BYTES,
+    THUMBNAIL_WORKERS,
+)
+from log_manager import log
+from utils.thumbnail import lower_priority, render_thumbnail
+from worker.output_index import IMAGE_EXTENSIONS, outputIndex
+
+DEFAULT_SIZE = 256
+WEBP_QUALITY = 80
+# New outputs waiting for a pre-rendered thumbnail; beyond this they are
+# rendered on first request instead
+PREGENERATE_QUEUE_SIZE = 1000
+# Eviction trims the cache to this fraction of THUMBNAIL_CACHE_BYTES
+EVICT_TARGET = 0.9
+
+
+class ThumbnailNotFound(Exception):
+    pass
+
+
+class ThumbnailCache:
+    """
+    Renders output thumbnails in a small, low-priority process pool and keeps
+    them on disk. A thumbnail is keyed by the image path, its size and mtime,
+    and the requested size, so a changed image gets a new key and ETag.
+    """
+
+    def __init__(self, output_path: str, cache_dir: Path, max_bytes: int):
+        self.root = Path(output_path).resolve()
+        self._dir = cache_dir
+        self._max_bytes = max_bytes
+        self._pool: ProcessPoolExecutor | None = None
+        self._pending: dict[str, asyncio.Future[Path]] = {}
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(
+            PREGENERATE_QUEUE_SIZE
+        )
+        self._cache_bytes: int | None = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                THUMBNAIL_WORKERS,
+                # Workers import only Pillow, not the backend and its event loop
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=lower_priority,
+            )
+        return self._pool
+
+    def resolve(self, rel_path: str) -> tuple[Path, os.stat_result]:
+        """Validate an output path from a request and stat it."""
+        path = (self.root / rel_path).resolve()
+        if (
+            not path.is_relative_to(self.root)
+            or path.suffix.lower() not in IMAGE_EXTENSIONS
+        ):
+            raise ThumbnailNotFound(rel_path)
+        try:
+            st = path.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            raise ThumbnailNotFound(rel_path)
+        return path, st
+
+    def key(self, rel_path: str, st: os.stat_result, size: int) -> str:
+        ident = f"{rel_path}\0{st.st_size}\0{st.st_mtime_ns}\0{size}\0{WEBP_QUALITY}"
+        return hashlib.sha256(ident.encode()).hexdigest()[:32]
+
+    def _cache_path(self, key: str) -> Path:
+        return self._dir / key[:2] / f"{key}.webp"
+
+    async def get(self, rel_path: str, size: int) -> tuple[Path, str]:
+        """Path and key of the thumbnail, rendering it if it is not cached."""
+        source, st = await asyncio.to_thread(self.resolve, rel_path)
+        key = self.key(rel_path, st, size)
+        target = self._cache_path(key)
+
+        try:
+            # The mtime orders thumbnails for eviction, least recently used first
+            await asyncio.to_thread(os.utime, target)
+            return target, key
+        except FileNotFoundError:
+            pass
+
+        # Concurrent requests for the same thumbnail share one render
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._render(key, source, target, size))
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(future), key
+
+    async def _render(self, key: str, source: Path, target: Path, size: int) -> Path:
+        loop = asyncio.get_running_loop()
+        written = await loop.run_in_executor(
+            self._get_pool(),
+            render_thumbnail,
+            str(source),
+            str(target),
+            size,
+            WEBP_QUALITY,
+        )
+        if self._cache_bytes is None:
+            self._cache_bytes = await asyncio.to_thread(self._disk_usage)
+        else:
+            self._cache_bytes += written
+        if self._cache_bytes > self._max_bytes:
+            self._cache_bytes = await asyncio.to_thread(self._evict)
+        return target
+
+    def _list_cache(self) -> list[tuple[float, int, Path]]:
+        thumbnails = []
+        for path in self._dir.glob("*/*.webp"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            thumbnails.append((st.st_mtime, st.st_size, path))
+        return thumbnails
+
+    def _disk_usage(self) -> int:
+        return sum(size for _, size, _ in self._list_cache())
+
+    def _evict(self) -> int:
+        """Remove least recently used thumbnails; returns the remaining size."""
+        thumbnails = sorted(self._list_cache())
+        total = sum(size for _, size, _ in thumbnails)
+        for _, size, path in thumbnails:
+            if total <= self._max_bytes * EVICT_TARGET:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        return total
+
+    def on_outputs_changed(self, added: list[dict[str, Any]], removed: list[str]):
+        """Output index listener: queue new images for a default thumbnail."""
+        for entry in added:
+            try:
+                self._queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                break
+
+    async def pregenerate(self) -> None:
+        """Render default-size thumbnails for new outputs, one at a time."""
+        outputIndex.add_listener(self.on_outputs_changed)
+        try:
+            while True:
+                entry = await self._queue.get()
+                try:
+                    await self.get(entry["path"], DEFAULT_SIZE)
+                except ThumbnailNotFound:
+                    pass
+                except Exception as e:
+                    log.warning(f"Could not render thumbnail of {entry['path']}: {e}")
+        finally:
+            outputIndex.remove_listener(self.on_outputs_changed)
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+thumbnailCache = ThumbnailCache(
+    OUTPUT_PATH, Path(CACHE_PATH) / "thumbnails", THUMBNAIL_CACHE_BYTES
+)